@@ -9,10 +9,14 @@ import aiohttp
 import asyncio
 import numpy as np
 import heapq
-from global_land_mask import globe
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fetch_weather import calculate_grid_weights, weather_array
+from land_mask import get_land_mask, grid_coordinates
+
 load_dotenv()
 
 # Configuration
@@ -20,37 +24,15 @@ API_KEY = os.getenv("OPENWEATHER_API_KEY", "")
 BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
 STEP_SIZE = 0.1
 
-# Weight coefficients for route calculation
-WEIGHT_COEFFICIENTS = {
-    'wind_speed': 0.25,
-    'wind_gust': 0.2,
-    'temperature': 0.1,
-    'visibility': 0.1,
-    'pressure': 0.1,
-    'humidity': 0.1
-}
-
-MAX_VALUES = {
-    'wind_speed': 15,
-    'wind_gust': 20,
-    'visibility': 10000
-}
-
 
 def generate_grid_with_buffer(lat1, lon1, lat2, lon2):
     """Generate grid points for pathfinding with buffer zone"""
     lat1, lat2 = sorted([lat1, lat2])
     lon1, lon2 = sorted([lon1, lon2])
 
-    grid_points = []
-    for row in np.arange(lat1 - 1, lat2 + 1.1, STEP_SIZE):
-        for col in np.arange(lon1 - 1, lon2 + 1.1, STEP_SIZE):
-            row = round(row, 1)
-            col = round(col, 1)
-            if (-90 <= row <= 90) and (-180 <= col <= 180):
-                grid_points.append((row, col))
-
-    return grid_points
+    # One meshgrid over integer cell indices instead of nested loops with per-point round()
+    lats, lons = grid_coordinates(lat1 - 1, lat2 + 1, lon1 - 1, lon2 + 1)
+    return list(zip(lats.tolist(), lons.tolist()))
 
 
 def parse_weather_data(condition):
@@ -67,35 +49,18 @@ def parse_weather_data(condition):
 
 def check_land(lat, lon):
     """Check if coordinates are on land"""
-    return globe.is_land(lat, lon)
+    return get_land_mask().is_land(lat, lon)
 
 
-def normalize(value, min_value, max_value):
-    """Normalize value between 0 and 1"""
-    if max_value == min_value:
-        return 0
-    return (value - min_value) / (max_value - min_value)
+def calculate_grid_weights_batch(grid_points, results):
+    """Calculate weighted costs for every fetched grid point in one vectorized batch"""
+    fetched = [(point, data) for point, data in zip(grid_points, results) if data]
+    if not fetched:
+        return {}
 
-
-def calculate_grid_weight(weather_data):
-    """Calculate weighted cost for grid cell based on weather conditions"""
-    norm_wind_speed = normalize(weather_data['wind_speed'], 0, MAX_VALUES['wind_speed'])
-    norm_wind_gust = normalize(weather_data['wind_gust'], 0, MAX_VALUES['wind_gust'])
-    norm_temperature = normalize(weather_data['temperature'], -30, 50)
-    norm_visibility = normalize(weather_data['visibility'], 0, MAX_VALUES['visibility'])
-    norm_pressure = normalize(weather_data['pressure'], 950, 1050)
-    norm_humidity = normalize(weather_data['humidity'], 0, 100)
-
-    total_weight = (
-        WEIGHT_COEFFICIENTS['wind_speed'] * norm_wind_speed +
-        WEIGHT_COEFFICIENTS['wind_gust'] * norm_wind_gust +
-        WEIGHT_COEFFICIENTS['temperature'] * norm_temperature +
-        WEIGHT_COEFFICIENTS['visibility'] * (1 - norm_visibility) +
-        WEIGHT_COEFFICIENTS['pressure'] * norm_pressure +
-        WEIGHT_COEFFICIENTS['humidity'] * norm_humidity
-    )
-
-    return max(total_weight, 0.1)  # Ensure minimum weight
+    weather = weather_array([parse_weather_data(data) for _, data in fetched])
+    weights = np.maximum(calculate_grid_weights(weather), 0.1)  # Ensure minimum weight
+    return dict(zip([point for point, _ in fetched], weights.tolist()))
 
 
 def heuristic(a, b):
@@ -191,18 +156,12 @@ async def get_path(lat1: float, lon1: float, lat2: float, lon2: float):
     grid_points = generate_grid_with_buffer(lat1, lon1, lat2, lon2)
     print(f"📍 Generated {len(grid_points)} grid points")
     
-    grid_weights = {}
-
     async with aiohttp.ClientSession() as session:
         print("🌤️  Fetching weather data...")
         tasks = [fetch_weather_data(session, row, col) for (row, col) in grid_points]
         results = await asyncio.gather(*tasks)
 
-        for i, data in enumerate(results):
-            if data:
-                weather_data = parse_weather_data(data)
-                grid_weight = calculate_grid_weight(weather_data)
-                grid_weights[grid_points[i]] = grid_weight
+        grid_weights = calculate_grid_weights_batch(grid_points, results)
 
         print(f"✅ Retrieved weather data for {len(grid_weights)} points")
 
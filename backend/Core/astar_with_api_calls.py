@@ -8,11 +8,15 @@ import aiohttp
 import asyncio
 import numpy as np
 import heapq
-from global_land_mask import globe
 import time
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fetch_weather import calculate_grid_weights, weather_array
+from land_mask import get_land_mask, grid_coordinates
+
 load_dotenv()
 
 # Configuration
@@ -36,33 +40,15 @@ TEST_ROUTES = {
     }
 }
 
-WEIGHT_COEFFICIENTS = {
-    'wind_speed': 0.25,
-    'wind_gust': 0.2,
-    'temperature': 0.1,
-    'visibility': 0.1,
-    'pressure': 0.1,
-    'humidity': 0.1
-}
-
-MAX_VALUES = {
-    'wind_speed': 15,
-    'wind_gust': 20,
-    'visibility': 10000
-}
-
 
 def generate_grid_with_buffer(lat1, lon1, lat2, lon2, lat_buffer=1, lon_buffer=1):
     """Generate grid with configurable buffer"""
     lat1, lat2 = sorted([lat1, lat2])
     lon1, lon2 = sorted([lon1, lon2])
 
-    grid_points = []
-    for row in np.arange(lat1 - lat_buffer, lat2 + lon_buffer + 0.1, STEP_SIZE):
-        for col in np.arange(lon1 - lon_buffer, lon2 + lon_buffer + 0.1, STEP_SIZE):
-            grid_points.append((round(row, 1), round(col, 1)))
-
-    return grid_points
+    # One meshgrid over integer cell indices instead of nested loops with per-point round()
+    lats, lons = grid_coordinates(lat1 - lat_buffer, lat2 + lat_buffer, lon1 - lon_buffer, lon2 + lon_buffer)
+    return list(zip(lats.tolist(), lons.tolist()))
 
 
 def parse_weather_data(condition):
@@ -79,35 +65,18 @@ def parse_weather_data(condition):
 
 def check_land(lat, lon):
     """Check if point is on land"""
-    return globe.is_land(lat, lon)
-
-
-def normalize(value, min_value, max_value):
-    """Normalize to 0-1 range"""
-    if max_value == min_value:
-        return 0
-    return (value - min_value) / (max_value - min_value)
-
+    return get_land_mask().is_land(lat, lon)
 
-def calculate_grid_weight(weather_data):
-    """Calculate weight from weather conditions"""
-    norm_wind_speed = normalize(weather_data['wind_speed'], 0, MAX_VALUES['wind_speed'])
-    norm_wind_gust = normalize(weather_data['wind_gust'], 0, MAX_VALUES['wind_gust'])
-    norm_temperature = normalize(weather_data['temperature'], -30, 50)
-    norm_visibility = normalize(weather_data['visibility'], 0, MAX_VALUES['visibility'])
-    norm_pressure = normalize(weather_data['pressure'], 950, 1050)
-    norm_humidity = normalize(weather_data['humidity'], 0, 100)
 
-    total_weight = (
-        WEIGHT_COEFFICIENTS['wind_speed'] * norm_wind_speed +
-        WEIGHT_COEFFICIENTS['wind_gust'] * norm_wind_gust +
-        WEIGHT_COEFFICIENTS['temperature'] * norm_temperature +
-        WEIGHT_COEFFICIENTS['visibility'] * (1 - norm_visibility) +
-        WEIGHT_COEFFICIENTS['pressure'] * norm_pressure +
-        WEIGHT_COEFFICIENTS['humidity'] * norm_humidity
-    )
+def calculate_grid_weights_batch(grid_points, results):
+    """Calculate weights for every fetched point in one batch"""
+    fetched = [(point, data) for point, data in zip(grid_points, results) if data]
+    if not fetched:
+        return {}
 
-    return max(total_weight, 0.1)
+    weather = weather_array([parse_weather_data(data) for _, data in fetched])
+    weights = np.maximum(calculate_grid_weights(weather), 0.1)  # Ensure minimum weight
+    return dict(zip([point for point, _ in fetched], weights.tolist()))
 
 
 def heuristic(a, b):
@@ -192,7 +161,6 @@ async def calculate_route(lat1, lon1, lat2, lon2):
     print(f"📍 Grid Generation: {grid_time:.4f}s | Points: {len(grid_points)}")
 
     # Fetch weather
-    grid_weights = {}
     start_time = time.time()
     
     async with aiohttp.ClientSession() as session:
@@ -204,11 +172,7 @@ async def calculate_route(lat1, lon1, lat2, lon2):
 
     # Calculate weights
     start_time = time.time()
-    for i, data in enumerate(results):
-        if data:
-            weather_data = parse_weather_data(data)
-            grid_weight = calculate_grid_weight(weather_data)
-            grid_weights[grid_points[i]] = grid_weight
+    grid_weights = calculate_grid_weights_batch(grid_points, results)
     calc_time = time.time() - start_time
     print(f"⚖️  Weight Calculation: {calc_time:.4f}s | Valid points: {len(grid_weights)}")
 
@@ -5,14 +5,17 @@ Faster than API version - uses pre-stored weather data
 """
 
 import asyncio
-import numpy as np
 import heapq
-from global_land_mask import globe
 import time
 import mysql.connector
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from grid_engine import Grid, a_star_grid
+from land_mask import get_land_mask, grid_coordinates, to_cell
+
 load_dotenv()
 
 # Configuration
@@ -40,20 +43,14 @@ def generate_grid_with_buffer(lat1, lon1, lat2, lon2):
     lat1, lat2 = sorted([lat1, lat2])
     lon1, lon2 = sorted([lon1, lon2])
 
-    grid_points = []
-    for row in np.arange(lat1 - 1, lat2 + 1.1, STEP_SIZE):
-        for col in np.arange(lon1 - 1, lon2 + 1.1, STEP_SIZE):
-            row = round(row, 1)
-            col = round(col, 1)
-            if (-90 <= row <= 90) and (-180 <= col <= 180):
-                grid_points.append((row, col))
-
-    return grid_points
+    # One meshgrid over integer cell indices instead of nested loops with per-point round()
+    lats, lons = grid_coordinates(lat1 - 1, lat2 + 1, lon1 - 1, lon2 + 1)
+    return list(zip(lats.tolist(), lons.tolist()))
 
 
 def check_land(lat, lon):
     """Check if point is on land"""
-    return globe.is_land(lat, lon)
+    return get_land_mask().is_land(lat, lon)
 
 
 def heuristic(a, b):
@@ -61,8 +58,8 @@ def heuristic(a, b):
     return abs(a[0] - b[0]) + abs(a[1] - b[1])
 
 
-def a_star(start, goal, grid_weights):
-    """A* pathfinding algorithm"""
+def a_star(start, goal, grid_weights, stats=None):
+    """A* pathfinding algorithm; counts expanded nodes in stats["expanded"] if given"""
     open_set = []
     heapq.heappush(open_set, (0, start))
     came_from = {}
@@ -81,6 +78,9 @@ def a_star(start, goal, grid_weights):
                 current = came_from[current]
             return path[::-1]
 
+        if stats is not None:
+            stats["expanded"] = stats.get("expanded", 0) + 1
+
         neighbors = [
             (round(current[0] + STEP_SIZE, 1), round(current[1], 1)),
             (round(current[0] - STEP_SIZE, 1), round(current[1], 1)),
@@ -148,22 +148,23 @@ async def calculate_route(lat1, lon1, lat2, lon2):
     # Fetch from database
     start_time = time.time()
     cursor.execute("""
-        SELECT weight FROM weather_data 
-        WHERE ROUND(latitude,1) BETWEEN %s AND %s
-        AND ROUND(longitude,1) BETWEEN %s AND %s;
-    """, (grid_latitude1, grid_latitude2, grid_longitude1, grid_longitude2))
+        SELECT latitude, longitude, weight FROM weather_data 
+        WHERE lat_i BETWEEN %s AND %s
+        AND lon_i BETWEEN %s AND %s;
+    """, (to_cell(grid_latitude1), to_cell(grid_latitude2), to_cell(grid_longitude1), to_cell(grid_longitude2)))
     results = cursor.fetchall()
     fetch_time = time.time() - start_time
 
-    results = [x[0] for x in results]
     print(f"💾 Database Fetch: {fetch_time:.4f}s | Records: {len(results)}")
 
-    # Build grid weights
+    # Build grid weights keyed by each row's own coordinates
     start_time = time.time()
+    grid_points_set = set(grid_points)
     grid_weights = {}
-    for i, data in enumerate(results):
-        if data and i < len(grid_points):
-            grid_weights[grid_points[i]] = data
+    for lat, lon, data in results:
+        point = (round(float(lat), 1), round(float(lon), 1))
+        if data and point in grid_points_set:
+            grid_weights[point] = data
     integrate_time = time.time() - start_time
     print(f"⚖️  Weight Integration: {integrate_time:.4f}s | Valid: {len(grid_weights)}")
 
@@ -178,15 +179,28 @@ async def calculate_route(lat1, lon1, lat2, lon2):
         return None
 
     start_time = time.time()
-    path = a_star(start_point, end_point, grid_weights)
+    legacy_stats = {}
+    path = a_star(start_point, end_point, grid_weights, legacy_stats)
     astar_time = time.time() - start_time
 
     cursor.close()
     conn.close()
 
+    # Same weights through the grid engine's great-circle cost model
+    start_time = time.time()
+    grid = Grid.from_bounds(lat1, lon1, lat2, lon2)
+    for point, weight in grid_weights.items():
+        cell = grid.cell(*point)
+        if cell is not None:
+            grid.weights[cell] = weight
+    result = a_star_grid(grid, grid.cell(*start_point), grid.cell(*end_point))
+    grid_time = time.time() - start_time
+
     total_time = time.time() - total_start
 
-    print(f"🔍 A* Pathfinding: {astar_time:.4f}s")
+    print(f"🔍 A* Pathfinding (Manhattan): {astar_time:.4f}s | Expanded: {legacy_stats.get('expanded', 0)}")
+    print(f"🔍 A* Pathfinding (great-circle): {grid_time:.4f}s | Expanded: {result.expanded}"
+          + (f" | Cost: {result.cost:.1f}" if result.path else ""))
     print(f"\n{'='*70}")
     print(f"⏱️  TOTAL TIME: {total_time:.4f}s")
     print(f"{'='*70}\n")
@@ -209,13 +223,13 @@ async def main():
     print("\n🚢 AquaIntel A* Database Pathfinding Test Suite")
     print("="*70)
     
-    # Run first test route
-    route_name, coords = list(TEST_ROUTES.items())[0]
-    lat1, lon1 = coords["start"]
-    lat2, lon2 = coords["end"]
-    
-    print(f"\nRunning test: {route_name}")
-    await calculate_route(lat1, lon1, lat2, lon2)
+    # Run every test route so node expansions can be compared
+    for route_name, coords in TEST_ROUTES.items():
+        lat1, lon1 = coords["start"]
+        lat2, lon2 = coords["end"]
+
+        print(f"\nRunning test: {route_name}")
+        await calculate_route(lat1, lon1, lat2, lon2)
 
 
 if __name__ == "__main__":
@@ -1,140 +1,256 @@
-import numpy as np
-import heapq
-from global_land_mask import globe
-import mysql.connector
+import asyncio
+import itertools
 import os
+from grid_engine import (Grid, a_star_grid, bidirectional_a_star_grid, box_bounds, haversine_km, multi_target_a_star_grid,
+                         time_dependent_a_star_grid)
+from land_mask import CELLS_PER_DEGREE, to_cell
+from pyramid import hierarchical_a_star_grid
+from route_cache import route_cache, route_key
+from weather_forecast import FORECAST_STEP_HOURS, FORECAST_STEPS, forecast_cache, load_grid_forecast
+from weather_version import changed_tiles_between, weather_version
+from weight_cache import fill_grid_weights, load_grid_weights_cached, load_tiles, tile_ids_for_grid, weight_cache
 from dotenv import load_dotenv
 
 load_dotenv()
 
-global step_size
-step_size = 0.1
-
-# Generate grid with buffer to perform A* Algorithm
-def generate_grid_with_buffer(lat1, lon1, lat2, lon2):
-    lat1, lat2 = sorted([lat1, lat2])
-    lon1, lon2 = sorted([lon1, lon2])
-
-    grid_points = []
-    for row in np.arange(lat1 - 1, lat2 + 1.1, step_size):
-        for col in np.arange(lon1 - 1, lon2 + 1.1, step_size):
-            row = round(row,1)
-            col = round(col,1)
-            if((row >= -90 and row <= 90) and (col >= -180 and col <= 180)):
-                grid_points.append((row, col))
-
-    return grid_points
-
-# Check if the given coordinates are on land
-def check_land(lat, lon):
-    return globe.is_land(lat, lon)
-
-# Heuristic function for A* algorithm
-def heuristic(a, b):
-    return abs(a[0] - b[0]) + abs(a[1] - b[1])
-
-# A* pathfinding algorithm
-def a_star(start, goal, grid_weights):
-    open_set = []
-    heapq.heappush(open_set, (0, start))
-    came_from = {}
-    g_score = {point: float('inf') for point in grid_weights}
-    g_score[start] = 0
-    f_score = {point: float('inf') for point in grid_weights}
-    f_score[start] = heuristic(start, goal)
-
-    while open_set:
-        current = heapq.heappop(open_set)[1]
-
-        if current == goal:
-            path = []
-            while current in came_from:
-                path.append(current)
-                current = came_from[current]
-            return path[::-1]
-
-        neighbors = [
-            (round(current[0] + step_size, 1), round(current[1], 1)),
-            (round(current[0] - step_size, 1), round(current[1], 1)),
-            (round(current[0], 1), round(current[1] + step_size, 1)),
-            (round(current[0], 1), round(current[1] - step_size, 1)),
-            (round(current[0] + step_size, 1), round(current[1] + step_size, 1)),
-            (round(current[0] - step_size, 1), round(current[1] + step_size, 1)),
-            (round(current[0] + step_size, 1), round(current[1] - step_size, 1)),
-            (round(current[0] - step_size, 1), round(current[1] - step_size, 1))
-        ]
-
-        for neighbor in neighbors:
-            if neighbor not in grid_weights:
-                continue
-
-            lat, lon = neighbor
-            if check_land(lat, lon):
-                continue
-
-            tentative_g_score = g_score[current] + grid_weights[neighbor]
-
-            if tentative_g_score < g_score[neighbor]:
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = tentative_g_score + heuristic(neighbor, goal)
-                heapq.heappush(open_set, (f_score[neighbor], neighbor))
-
-    return None
-
-# Connect Database
-def connect_db():
-    return mysql.connector.connect(
-        database=os.getenv("MYSQL_DATABASE", "AquaIntel"),
-        user=os.getenv("MYSQL_USER", "root"),
-        password=os.getenv("MYSQL_PASSWORD", "password"),
-        host=os.getenv("MYSQL_HOST", "127.0.0.1"),
-        port=int(os.getenv("MYSQL_PORT", "3306"))
-    )
+# Default width of the great-circle band searched around each route; 0 searches the whole bounding box
+ROUTE_CORRIDOR_KM = float(os.getenv("ROUTE_CORRIDOR_KM", "0"))
+
+# Vessel speed of time-dependent routes unless given, the same as estimate_travel_time's
+DEFAULT_SPEED_KNOTS = 15
+KM_PER_NAUTICAL_MILE = 1.852
+
+# Forecast steps are loaded for up to this multiple of the great-circle sailing time; sea routes
+# rarely sail more than 1.3x the great circle, and cells reached later use the last step loaded
+FORECAST_DETOUR_FACTOR = 1.5
+
+# Search strategies selectable per request
+SEARCH_MODES = {
+    "astar": a_star_grid,
+    "bidirectional": bidirectional_a_star_grid,
+    "hierarchical": hierarchical_a_star_grid
+}
+
+def route_grids(lat1, lon1, lat2, lon2, mode, corridor_km):
+    """Grids to search in order: the great-circle corridor if enabled, then the full bounding box"""
+    # The pyramid aggregates rectangular blocks, so hierarchical mode always searches the full box
+    if corridor_km and mode != "hierarchical":
+        corridor = Grid.from_corridor(lat1, lon1, lat2, lon2, corridor_km)
+        # A band bulging poleward past the box can still outgrow it; then the box alone is cheaper
+        _, _, n_rows, n_cols = box_bounds([lat1, lat2], [lon1, lon2])
+        if corridor.size < n_rows * n_cols:
+            yield corridor
+    yield Grid.from_bounds(lat1, lon1, lat2, lon2)
 
 # Calculate the path based on weather data and A* algorithm
-async def get_path(lat1: float, lon1: float, lat2: float, lon2: float):
-    grid_points = generate_grid_with_buffer(lat1, lon1, lat2, lon2)
-    grid_weights = {}
+async def get_path(pool, lat1: float, lon1: float, lat2: float, lon2: float, executor=None, mode="astar",
+                   corridor_km=None, tiles=None, grids=None, loaded_tiles=None, departure=None,
+                   speed_knots=DEFAULT_SPEED_KNOTS):
+    # tiles, if given, collects the weight tiles read so cached results can be invalidated per tile.
+    # grids overrides route_grids; loaded_tiles (tile id -> WeightTile) is used for grids it fully covers.
+    # With a departure (Unix time) the search is time-dependent on the forecast, whatever the mode
+    if corridor_km is None:
+        corridor_km = ROUTE_CORRIDOR_KM
+    if grids is None:
+        grids = route_grids(lat1, lon1, lat2, lon2, mode, corridor_km)
+
+    # A corridor blocked by land (e.g. a strait off the great circle) falls back to the whole box
+    for grid in grids:
+        grid_tiles = tile_ids_for_grid(grid)
+        if loaded_tiles is not None and all(tile_id in loaded_tiles for tile_id in grid_tiles):
+            fill_grid_weights(grid, {tile_id: loaded_tiles[tile_id] for tile_id in grid_tiles})
+        else:
+            # Served from the in-process tile cache; the pool is only used for missing or expired tiles
+            await load_grid_weights_cached(weight_cache, pool, grid)
+        if tiles is not None:
+            tiles.update(grid_tiles)
+
+        start_point = grid.cell(lat1, lon1)
+        end_point = grid.cell(lat2, lon2)
+
+        # Ensure start and end points are present in the grid weights
+        if not grid.has_weight(start_point) or not grid.has_weight(end_point):
+            return {"error": "Start or end point is missing from grid weights."}
+
+        search = SEARCH_MODES[mode]
+        args = (grid, start_point, end_point)
+        if departure is not None:
+            # Forecast steps the voyage may reach, from the same tiles (and tile cache) layout as the weights
+            speed_kmh = speed_knots * KM_PER_NAUTICAL_MILE
+            hours = min(FORECAST_DETOUR_FACTOR * float(haversine_km(lat1, lon1, lat2, lon2)) / speed_kmh,
+                        FORECAST_STEPS * FORECAST_STEP_HOURS)
+            first, forecast = await load_grid_forecast(pool, grid, departure, hours)
+            search = time_dependent_a_star_grid
+            args += (forecast, (departure - first) / 3600, speed_kmh, FORECAST_STEP_HOURS)
+
+        # Execute the A* algorithm to find the optimal path, off the event loop when an executor is given
+        if executor is not None:
+            result = await executor.run(search, *args)
+        else:
+            result = search(*args)
+        path = result.path
+        if path:
+            # Format the path as JSON with (lat, lon) tuples
+            formatted_path = [(lat, lon) for lat, lon in path]
+            return {"path": formatted_path}
+
+    return {"error": "No path found"}
 
-    conn = connect_db()
-    cursor = conn.cursor()
+# Bring the route and weight caches up to the current weather version; returns the version
+async def sync_weather_version(pool):
+    version = await weather_version.current(pool)
+    if version != route_cache.version:
+        # A refresh completed: drop routes and weight tiles over the cells it rewrote
+        changed_tiles = None
+        if route_cache.version is not None:
+            changed_tiles = await changed_tiles_between(pool, route_cache.version, version)
+        route_cache.set_version(version, changed_tiles)
+        weight_cache.invalidate(changed_tiles)
+        forecast_cache.invalidate(changed_tiles)
+    return version
 
-    length = len(grid_points)
+# Route cache key of a request; a time-dependent route's key adds its departure, snapped to the hour, and speed
+def cache_key(lat1, lon1, lat2, lon2, mode, corridor_km, departure=None, speed_knots=DEFAULT_SPEED_KNOTS):
+    if corridor_km is None:
+        corridor_km = ROUTE_CORRIDOR_KM
+    key = route_key(lat1, lon1, lat2, lon2, mode, corridor_km)
+    if departure is not None:
+        key += (round(departure / 3600) * 3600, speed_knots)
+    return key
 
-    grid_latitude1, grid_longitude1 = grid_points[0]
-    grid_latitude2, grid_longitude2 = grid_points[length - 1]
+# Snapped (lat1, lon1, lat2, lon2) of a route cache key
+def key_endpoints(key):
+    return tuple(cell / CELLS_PER_DEGREE for cell in key[:4])
 
-    cursor.execute("""
-        SELECT weight FROM weather_data 
-        WHERE ROUND(latitude,1) BETWEEN %s AND %s
-        AND ROUND(longitude,1) BETWEEN %s AND %s;
-    """, (grid_latitude1, grid_latitude2, grid_longitude1, grid_longitude2))
+# get_path options of a route cache key
+def key_options(key):
+    options = {"mode": key[4], "corridor_km": key[5]}
+    if len(key) > 6:
+        options.update(departure=key[6], speed_knots=key[7])
+    return options
 
-    results = cursor.fetchall()
-    results = [x[0] for x in results]
+# Route through the route cache; returns (result, cached)
+async def get_path_cached(pool, lat1: float, lon1: float, lat2: float, lon2: float, executor=None, mode="astar",
+                          corridor_km=None, departure=None, speed_knots=DEFAULT_SPEED_KNOTS):
+    version = await sync_weather_version(pool)
 
-    for i, data in enumerate(results):
-        if data:
-            grid_weights[grid_points[i]] = data
+    key = cache_key(lat1, lon1, lat2, lon2, mode, corridor_km, departure, speed_knots)
+    result = route_cache.get(key)
+    if result is not None:
+        return result, True
 
-    start_point = (round(lat1, 1), round(lon1, 1))
-    end_point = (round(lat2, 1), round(lon2, 1))
+    # Solve from the snapped endpoints (and departure) so every request sharing this key gets the same route
+    tiles = set()
+    result = await get_path(pool, *key_endpoints(key), executor=executor, tiles=tiles, **key_options(key))
+    # Only cache results of the version they were computed from
+    if route_cache.version == version:
+        route_cache.put(key, result, tiles)
+    return result, False
 
-    # Ensure start and end points are present in the grid weights
-    if start_point not in grid_weights or end_point not in grid_weights:
-        return {"error": "Start or end point is missing from grid weights."}
+# Solve many routes at once; yields (index, result, cached) for each route in the order they finish
+async def get_paths_batch(pool, routes, executor=None, concurrency=None):
+    """
+    routes is a list of (lat1, lon1, lat2, lon2, mode, corridor_km, departure, speed_knots)
+    with departure None for routes on the current weather. Cached routes
+    come first; routes sharing a cache key are solved once. The weight tiles of
+    every route's first grid are loaded together, over one connection for the
+    tiles not already cached, before the searches start. At most concurrency
+    searches (default: the executor's workers) run at a time. A route whose
+    search fails yields the exception as its result.
+    """
+    version = await sync_weather_version(pool)
 
-    # Execute the A* algorithm to find the optimal path
-    path = a_star(start_point, end_point, grid_weights)
-    if path:
-        # Format the path as JSON with (lat, lon) tuples
-        formatted_path = [(lat, lon) for lat, lon in path]
-        return {"path": formatted_path}
+    pending = {}
+    for index, route in enumerate(routes):
+        key = cache_key(*route)
+        result = route_cache.get(key)
+        if result is not None:
+            yield index, result, True
+        else:
+            pending.setdefault(key, []).append(index)
+    if not pending:
+        return
+
+    # Every route's first grid, and one load of the union of their tiles
+    grids = {key: route_grids(*key_endpoints(key), key[4], key[5]) for key in pending}
+    first_grids = {key: next(key_grids) for key, key_grids in grids.items()}
+    tile_ids = dict.fromkeys(tile_id for grid in first_grids.values() for tile_id in tile_ids_for_grid(grid))
+    loaded_tiles = await load_tiles(weight_cache, pool, tile_ids)
+
+    if concurrency is None:
+        concurrency = executor.workers if executor is not None else 1
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def solve(key):
+        tiles = set()
+        async with semaphore:
+            try:
+                result = await get_path(pool, *key_endpoints(key), executor=executor, tiles=tiles,
+                                        grids=itertools.chain([first_grids.pop(key)], grids.pop(key)),
+                                        loaded_tiles=loaded_tiles, **key_options(key))
+            except Exception as e:
+                return key, e
+        if route_cache.version == version:
+            route_cache.put(key, result, tiles)
+        return key, result
+
+    tasks = [asyncio.ensure_future(solve(key)) for key in pending]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            key, result = await finished
+            for index in pending[key]:
+                yield index, result, False
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# One search from an origin to several targets; returns one result per target, in order
+async def get_paths_to_targets(pool, lat: float, lon: float, targets, executor=None):
+    """
+    targets is a list of (lat, lon). All of them share one grid, the box around
+    the origin and every target, and one multi-target A*, so picking the best of
+    several destinations costs about one search. Endpoints are snapped to cells
+    like get_path_cached. Each result is {"path", "cost"} or {"error"}; cost is
+    the weighted length in km that the searches minimize.
+    """
+    await sync_weather_version(pool)
+
+    lat, lon = to_cell(lat) / CELLS_PER_DEGREE, to_cell(lon) / CELLS_PER_DEGREE
+    targets = [(to_cell(target_lat) / CELLS_PER_DEGREE, to_cell(target_lon) / CELLS_PER_DEGREE)
+               for target_lat, target_lon in targets]
+    grid = Grid.from_points([lat] + [target[0] for target in targets], [lon] + [target[1] for target in targets])
+    await load_grid_weights_cached(weight_cache, pool, grid)
+
+    start_point = grid.cell(lat, lon)
+    if not grid.has_weight(start_point):
+        return [{"error": "Start or end point is missing from grid weights."} for _ in targets]
+
+    goals = {}
+    for index, (target_lat, target_lon) in enumerate(targets):
+        end_point = grid.cell(target_lat, target_lon)
+        if grid.has_weight(end_point):
+            goals[index] = end_point
+    if not goals:
+        return [{"error": "Start or end point is missing from grid weights."} for _ in targets]
+
+    if executor is not None:
+        search_results = await executor.run(multi_target_a_star_grid, grid, start_point, list(goals.values()))
     else:
-        return {"error": "No path found"}
+        search_results = multi_target_a_star_grid(grid, start_point, list(goals.values()))
+    search_results = dict(zip(goals, search_results))
+
+    results = []
+    for index in range(len(targets)):
+        result = search_results.get(index)
+        if result is None:
+            results.append({"error": "Start or end point is missing from grid weights."})
+        elif not result.path:
+            results.append({"error": "No path found"})
+        else:
+            results.append({"path": [(lat, lon) for lat, lon in result.path], "cost": result.cost})
+    return results
 
 # Example usage
-# asyncio.run(get_path(18.93705, 72.92861, 22.48208, 69.80712))
+# asyncio.run(get_path(pool, 18.93705, 72.92861, 22.48208, 69.80712))
 # lat1, lon1 = 18.93705, 72.92861
 # lat2, lon2 = 22.48208, 69.80712
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""
+Build the 0.1° land/sea bitmap used by the router.
+
+Usage:
+    python build_land_mask.py [--output PATH]
+"""
+
+import argparse
+import time
+from land_mask import LAND_MASK_PATH, build_land_mask, save_land_mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the 0.1° land/sea bitmap")
+    parser.add_argument("--output", default=LAND_MASK_PATH, help="Path of the .npy file to write")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    mask = build_land_mask()
+    save_land_mask(mask, args.output)
+
+    print(f"Wrote {args.output}: {mask.shape[0]}x{mask.shape[1]} cells, "
+          f"{mask.mean() * 100:.1f}% land, {time.time() - start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+MySQL connections.
+
+connect_db opens a blocking connection for scripts. The API uses a shared
+aiomysql pool created once in the FastAPI lifespan and stored on app.state;
+its sizes and acquire timeout come from the environment:
+
+    MYSQL_POOL_MIN_SIZE       connections kept open (default 2)
+    MYSQL_POOL_MAX_SIZE       upper bound on open connections (default 20)
+    MYSQL_POOL_ACQUIRE_TIMEOUT seconds to wait for a free connection (default 5)
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+import aiomysql
+import mysql.connector
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MYSQL_POOL_MIN_SIZE = int(os.getenv("MYSQL_POOL_MIN_SIZE", "2"))
+MYSQL_POOL_MAX_SIZE = int(os.getenv("MYSQL_POOL_MAX_SIZE", "20"))
+MYSQL_POOL_ACQUIRE_TIMEOUT = float(os.getenv("MYSQL_POOL_ACQUIRE_TIMEOUT", "5"))
+
+
+def connect_db():
+    return mysql.connector.connect(
+        database=os.getenv("MYSQL_DATABASE", "AquaIntel"),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", "password"),
+        host=os.getenv("MYSQL_HOST", "127.0.0.1"),
+        port=int(os.getenv("MYSQL_PORT", "3306"))
+    )
+
+
+async def create_pool(minsize=MYSQL_POOL_MIN_SIZE, maxsize=MYSQL_POOL_MAX_SIZE, **kwargs):
+    return await aiomysql.create_pool(
+        db=os.getenv("MYSQL_DATABASE", "AquaIntel"),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", "password"),
+        host=os.getenv("MYSQL_HOST", "127.0.0.1"),
+        port=int(os.getenv("MYSQL_PORT", "3306")),
+        minsize=minsize,
+        maxsize=maxsize,
+        **kwargs
+    )
+
+
+async def close_pool(pool):
+    pool.close()
+    await pool.wait_closed()
+
+
+@asynccontextmanager
+async def acquire(pool, timeout=MYSQL_POOL_ACQUIRE_TIMEOUT):
+    """Borrow a connection, raising asyncio.TimeoutError if none frees up in time"""
+    conn = await asyncio.wait_for(pool.acquire(), timeout)
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
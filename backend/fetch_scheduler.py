@@ -0,0 +1,182 @@
+"""
+Rate-limited scheduler for OpenWeatherMap requests.
+
+Every API key gets a token bucket refilled at WEATHER_API_RATE requests per
+second (bursts up to WEATHER_API_BURST); each request takes a token from
+whichever key has one. At most WEATHER_API_MAX_IN_FLIGHT requests are open
+at once. Responses 429 and 5xx, and connection errors, are retried up to
+WEATHER_API_MAX_RETRIES times with exponential backoff and jitter; a 429
+also pauses that key for its Retry-After (or the backoff delay).
+
+Keys come from WEATHER_API_KEYS (comma-separated), falling back to
+WEATHER_API_KEY.
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+import aiohttp
+import fetch_weather
+from dotenv import load_dotenv
+
+# Scripts may import this before anything else has loaded .env
+load_dotenv()
+
+WEATHER_API_RATE = float(os.getenv("WEATHER_API_RATE", "10"))
+WEATHER_API_BURST = int(os.getenv("WEATHER_API_BURST", str(max(int(WEATHER_API_RATE), 1))))
+WEATHER_API_MAX_IN_FLIGHT = int(os.getenv("WEATHER_API_MAX_IN_FLIGHT", "50"))
+WEATHER_API_MAX_RETRIES = int(os.getenv("WEATHER_API_MAX_RETRIES", "5"))
+WEATHER_API_BACKOFF = float(os.getenv("WEATHER_API_BACKOFF", "0.5"))
+WEATHER_API_BACKOFF_MAX = float(os.getenv("WEATHER_API_BACKOFF_MAX", "30"))
+
+# Window for the recent requests/sec figure, in seconds
+RATE_WINDOW = 60
+
+
+def api_keys():
+    keys = [key.strip() for key in os.getenv("WEATHER_API_KEYS", "").split(",") if key.strip()]
+    return keys or [os.getenv("WEATHER_API_KEY", "api_key")]
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def try_acquire(self):
+        """Take a token; returns 0 on success, otherwise the seconds until one is available"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """Stop handing out tokens for a while, e.g. after the key was throttled"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class FetchMetrics:
+    def __init__(self):
+        self.started_at = None
+        self.requests = 0
+        self.succeeded = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.connection_errors = 0
+        self.retries = 0
+        self.failed = 0
+        self.recent = deque()
+
+    def record_request(self):
+        now = time.time()
+        if self.started_at is None:
+            self.started_at = now
+        self.requests += 1
+        self.recent.append(now)
+        while self.recent[0] < now - RATE_WINDOW:
+            self.recent.popleft()
+
+    def stats(self):
+        elapsed = max(time.time() - (self.started_at or time.time()), 1e-9)
+        return {
+            "requests": self.requests,
+            "succeeded": self.succeeded,
+            "throttled": self.throttled,
+            "server_errors": self.server_errors,
+            "connection_errors": self.connection_errors,
+            "retries": self.retries,
+            "failed": self.failed,
+            "requests_per_sec": round(self.requests / elapsed, 2),
+            "recent_requests_per_sec": round(len(self.recent) / min(elapsed, RATE_WINDOW), 2)
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"{stats['requests_per_sec']} req/s ({stats['recent_requests_per_sec']} recent), "
+                f"{stats['succeeded']} ok, {stats['throttled']} throttled, {stats['retries']} retries, "
+                f"{stats['failed']} failed")
+
+
+class FetchScheduler:
+    def __init__(self, keys=None, rate=WEATHER_API_RATE, burst=WEATHER_API_BURST,
+                 max_in_flight=WEATHER_API_MAX_IN_FLIGHT, max_retries=WEATHER_API_MAX_RETRIES,
+                 backoff=WEATHER_API_BACKOFF, backoff_max=WEATHER_API_BACKOFF_MAX):
+        self.buckets = {key: TokenBucket(rate, burst) for key in (keys or api_keys())}
+        self.keys = list(self.buckets)
+        self.next_key = 0
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.metrics = FetchMetrics()
+
+    async def acquire_key(self):
+        """Wait for a token from any key, rotating so load spreads across keys"""
+        while True:
+            waits = []
+            for i in range(len(self.keys)):
+                key = self.keys[(self.next_key + i) % len(self.keys)]
+                wait = self.buckets[key].try_acquire()
+                if wait == 0:
+                    self.next_key = (self.next_key + i + 1) % len(self.keys)
+                    return key
+                waits.append(wait)
+            await asyncio.sleep(min(waits))
+
+    def backoff_delay(self, attempt):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    async def fetch(self, session, lat, lon, url=None):
+        """
+        Current weather JSON for a point, or None once retries are exhausted or on a non-retryable error.
+        url selects another endpoint taking the same parameters, e.g. the forecast.
+        """
+        fetch_weather.initialization()
+        url = url or fetch_weather.base_url
+        for attempt in range(self.max_retries + 1):
+            key = await self.acquire_key()
+            delay = self.backoff_delay(attempt)
+            params = {"lat": lat, "lon": lon, "appid": key, "units": "metric"}
+
+            async with self.in_flight:
+                self.metrics.record_request()
+                try:
+                    async with session.get(url, params=params) as response:
+                        if response.status == 200:
+                            self.metrics.succeeded += 1
+                            return await response.json()
+
+                        if response.status == 429:
+                            self.metrics.throttled += 1
+                            retry_after = response.headers.get("Retry-After", "")
+                            if retry_after.isdigit():
+                                delay = max(delay, float(retry_after))
+                            self.buckets[key].pause(delay)
+                        elif response.status >= 500:
+                            self.metrics.server_errors += 1
+                        else:
+                            print(f"Error retrieving data for point ({lat}, {lon}), Status code: {response.status}")
+                            self.metrics.failed += 1
+                            return None
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self.metrics.connection_errors += 1
+
+            if attempt < self.max_retries:
+                self.metrics.retries += 1
+                await asyncio.sleep(delay)
+
+        print(f"Giving up on point ({lat}, {lon}) after {self.max_retries + 1} attempts")
+        self.metrics.failed += 1
+        return None
@@ -1,27 +1,34 @@
+import os
+import numpy as np
 from datetime import datetime
 
+# Weight coefficients and normalization maxima for the weather fields
+weight_coefficients = {
+    'wind_speed': 0.25,
+    'wind_gust': 0.2,
+    'temperature': 0.1,
+    'visibility': 0.1,
+    'pressure': 0.1,
+    'humidity': 0.1
+}
+
+max_values = {
+    'wind_speed': 15,
+    'wind_gust': 20,
+    'visibility': 10000
+}
+
+# Weather fields in weight order, as a structured array dtype for batch weighting
+WEATHER_FIELDS = ('wind_speed', 'wind_gust', 'temperature', 'visibility', 'pressure', 'humidity')
+WEATHER_DTYPE = np.dtype([(field, np.float64) for field in WEATHER_FIELDS])
+
 # Initialize global variables for the weather routing algorithm
 def initialization():
-    global api_key, base_url, weight_coefficients, max_values, step_size
-    api_key = "api_key"
+    global api_key, base_url, step_size
+    api_key = os.getenv("WEATHER_API_KEY", "api_key")
     base_url = "https://api.openweathermap.org/data/2.5/weather"
     step_size = 0.1
 
-    weight_coefficients = {
-        'wind_speed': 0.25,
-        'wind_gust': 0.2,
-        'temperature': 0.1,
-        'visibility': 0.1,
-        'pressure': 0.1,
-        'humidity': 0.1
-    }
-
-    max_values = {
-        'wind_speed': 15,
-        'wind_gust': 20,
-        'visibility': 10000
-    }
-
 # Determine if weather conditions are favorable
 def parse_weather_data(condition):
     wind_speed = condition.get('wind', {}).get('speed', 0)
@@ -44,14 +51,18 @@ def parse_weather_data(condition):
 def normalize(value, min_value, max_value):
     return (value - min_value) / (max_value - min_value)
 
-# Calculate grid weights based on weather conditions
-def calculate_grid_weight(weather_data):
-    norm_wind_speed = normalize(weather_data['wind_speed'], 0, max_values['wind_speed'])
-    norm_wind_gust = normalize(weather_data['wind_gust'], 0, max_values['wind_gust'])
-    norm_temperature = normalize(weather_data['temperature'], -30, 50)
-    norm_visibility = normalize(weather_data['visibility'], 0, max_values['visibility'])
-    norm_pressure = normalize(weather_data['pressure'], 950, 1050)
-    norm_humidity = normalize(weather_data['humidity'], 0, 100)
+# Pack parsed weather dicts into a structured array for calculate_grid_weights
+def weather_array(weather_data):
+    return np.array([tuple(data[field] for field in WEATHER_FIELDS) for data in weather_data], dtype=WEATHER_DTYPE)
+
+# Calculate grid weights for a structured array of weather conditions in one vectorized pass
+def calculate_grid_weights(weather):
+    norm_wind_speed = normalize(weather['wind_speed'], 0, max_values['wind_speed'])
+    norm_wind_gust = normalize(weather['wind_gust'], 0, max_values['wind_gust'])
+    norm_temperature = normalize(weather['temperature'], -30, 50)
+    norm_visibility = normalize(weather['visibility'], 0, max_values['visibility'])
+    norm_pressure = normalize(weather['pressure'], 950, 1050)
+    norm_humidity = normalize(weather['humidity'], 0, 100)
 
     total_weight = (
             weight_coefficients['wind_speed'] * norm_wind_speed +
@@ -74,13 +85,15 @@ async def fetch_weather_data(session, lat, lon):
             print(f"Error retrieving data for point ({lat}, {lon}), Status code: {response.status}")
             return None
 
-# Return grid weight by performing all the functions
-async def get_grid_weight(session, lat, lon):
-    initialization()
+# Weight (coordinate, API response) pairs in one vectorized pass.
+# Returns (lat, lon, weight, datetime) tuples.
+def weigh_responses(fetched):
+    if not fetched:
+        return []
 
-    data = await fetch_weather_data(session, lat, lon)
-    if data:
-        weather_data = parse_weather_data(data)
-        grid_weight = calculate_grid_weight(weather_data)
-        return float(lat), float(lon), grid_weight, datetime.now()
-    return lat, lon, None
\ No newline at end of file
+    weights = calculate_grid_weights(weather_array([parse_weather_data(data) for _, data in fetched]))
+    now = datetime.now()
+    return [
+        (float(lat), float(lon), float(weight), now)
+        for ((lat, lon), _), weight in zip(fetched, weights)
+    ]
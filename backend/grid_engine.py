@@ -0,0 +1,674 @@
+"""
+Dense NumPy grid engine for A* routing.
+
+A route's bounding box is mapped to 2-D arrays on the global 0.1° cell layout
+(row 0 = latitude -90, column 0 = longitude -180). Weights, the land mask,
+g-scores and parent pointers all live in flat arrays and the search runs on
+integer cell indices instead of rounded (lat, lon) tuples.
+
+Longitude wraps around: a grid across the antimeridian keeps consecutive
+global columns past 180° (or before -180°), and everything that reads global
+data (land mask, weight tiles) takes them modulo LON_PERIOD. Output
+coordinates are wrapped back into [-180, 180].
+
+Costs are in weighted kilometres: each step costs its haversine length times
+the weight of the cell it enters.
+"""
+
+import heapq
+import time
+from typing import List, NamedTuple, Optional, Tuple
+import numpy as np
+from land_mask import (CELLS_PER_DEGREE, LAT_CELLS, LON_CELLS, LON_PERIOD, STEP_SIZE, get_land_mask, lat_to_row,
+                       lon_to_col, wrap_lon)
+
+# 8-directional moves as (row, col) offsets
+NEIGHBOR_OFFSETS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+# How many expansions run between deadline checks
+DEADLINE_CHECK_INTERVAL = 4096
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 2 * np.pi * EARTH_RADIUS_KM / 360
+
+# Floor for cell weights so every step has a positive cost
+MIN_CELL_WEIGHT = 0.1
+
+
+class SearchTimeout(Exception):
+    """Raised when a search runs past its deadline"""
+
+
+class SearchResult(NamedTuple):
+    path: Optional[List[Tuple[float, float]]]  # (lat, lon) cells after the start, None if unreachable
+    cost: Optional[float]                      # weighted length in km
+    expanded: int                              # nodes expanded, for comparing search strategies
+
+
+class Grid:
+    """
+    Weights and land mask for a block of cells.
+
+    factor is the number of 0.1° cells along each side of a grid cell: 1 for
+    the routing grid, larger for the coarse levels of the routing pyramid. Row
+    and column indices are global at that resolution.
+
+    Every row holds n_cols cells. By default all rows start at col_min and the
+    grid is a rectangle; a corridor grid passes col_starts so that each row's
+    window follows the route, keeping memory linear in route length.
+    """
+
+    def __init__(self, row_min, col_min, n_rows, n_cols, factor=1, land=None, col_starts=None):
+        self.row_min = row_min
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.factor = factor
+        # Global column of local column 0, per row
+        if col_starts is None:
+            col_starts = np.full(n_rows, col_min, dtype=np.int64)
+        self.col_starts = np.asarray(col_starts, dtype=np.int64)
+        self.col_min = int(self.col_starts.min())
+        self.is_rectangular = bool((self.col_starts == self.col_min).all())
+        # NaN marks cells without weather data; they are treated as impassable
+        self.weights = np.full((n_rows, n_cols), np.nan, dtype=np.float32)
+        if land is not None:
+            self.land = land
+        elif self.is_rectangular and not self.wraps:
+            self.land = get_land_mask().box(self.lat_min, self.lat_max, self.lon_min, self.lon_max)
+        else:
+            self.land = get_land_mask().windows(row_min, self.col_starts, n_cols)
+
+    @classmethod
+    def from_bounds(cls, lat1, lon1, lat2, lon2, buffer=1.0):
+        """
+        The endpoints' rectangle plus a buffer in degrees, clipped to the
+        globe's latitudes. It spans the shorter way round in longitude,
+        across the antimeridian if that is shorter.
+        """
+        return cls.from_points([lat1, lat2], [lon1, lon2], buffer)
+
+    @classmethod
+    def from_points(cls, lats, lons, buffer=1.0):
+        """
+        Box around any number of points plus a buffer, like from_bounds; in
+        longitude it spans the shortest arc holding every point.
+        """
+        return cls(*box_bounds(lats, lons, buffer))
+
+    @classmethod
+    def from_corridor(cls, lat1, lon1, lat2, lon2, width_km):
+        """
+        Band of cells within width_km / 2 of the great circle between the
+        endpoints. Each row covers the band's span at that latitude; cells of
+        the row window outside the band are marked as land so the search
+        stays inside it.
+        """
+        radius = width_km / 2
+        distance = float(haversine_km(lat1, lon1, lat2, lon2))
+        # Consecutive sample discs overlap, so the band has no gaps
+        samples = great_circle_points(lat1, lon1, lat2, lon2, int(np.ceil(distance / radius)) + 1)
+        # Continuous longitudes, so a band across the antimeridian is not torn apart at ±180°
+        samples[:, 1] = np.degrees(np.unwrap(np.radians(samples[:, 1])))
+
+        rows = np.arange(
+            max(int(lat_to_row(samples[:, 0].min() - radius / KM_PER_DEGREE)), 0),
+            min(int(lat_to_row(samples[:, 0].max() + radius / KM_PER_DEGREE)), LAT_CELLS - 1) + 1
+        )
+        row_lats = rows / CELLS_PER_DEGREE - 90
+
+        # Longitude half-width of every sample disc at every row
+        dlat_km = np.abs(row_lats[:, None] - samples[None, :, 0]) * KM_PER_DEGREE
+        hits = dlat_km <= radius
+        half_km = np.sqrt(np.maximum(radius ** 2 - dlat_km ** 2, 0))
+        cos_lat = np.maximum(np.cos(np.radians(row_lats)), 1e-6)[:, None]
+        half_deg = np.minimum(half_km / (KM_PER_DEGREE * cos_lat), 180)
+
+        # Drop edge rows that no disc reaches
+        covered = hits.any(axis=1)
+        first, last = np.argmax(covered), len(covered) - np.argmax(covered[::-1])
+        rows, hits, half_deg = rows[first:last], hits[first:last], half_deg[first:last]
+
+        west = np.where(hits, samples[None, :, 1] - half_deg, np.inf).min(axis=1)
+        east = np.where(hits, samples[None, :, 1] + half_deg, -np.inf).max(axis=1)
+        starts = lon_to_col(west)
+        # Near the poles a row can span every longitude, but never more than once around
+        ends = np.minimum(lon_to_col(east), starts + LON_PERIOD - 1)
+
+        # Clip every row to the columns of the from_bounds box, so the band is never wider than the box where
+        # columns are narrow; the great circle's longitudes stay between the endpoints', so its centre line is kept
+        _, box_col_min, _, box_cols = box_bounds([lat1, lat2], [lon1, lon2])
+        if box_cols < LON_PERIOD:
+            # The box in the samples' continuous longitudes
+            box_col_min += (int(lon_to_col(samples[0, 1])) - box_col_min) // LON_PERIOD * LON_PERIOD
+            starts = np.maximum(starts, box_col_min)
+            ends = np.minimum(ends, box_col_min + box_cols - 1)
+        n_cols = max(int((ends - starts).max()) + 1, 1)
+
+        grid = cls(int(rows[0]), 0, len(rows), n_cols, col_starts=starts)
+        cols = starts[:, None] + np.arange(n_cols)[None, :]
+        grid.land = grid.land | (cols > ends[:, None])
+        return grid
+
+    @property
+    def step(self):
+        """Cell size in degrees"""
+        return self.factor * STEP_SIZE
+
+    # lat_min / lat_max / lon_min / lon_max are the 0.1° cell bounds of a factor-1 grid
+    @property
+    def lat_min(self):
+        return round(self.row_min / CELLS_PER_DEGREE - 90, 1)
+
+    @property
+    def lat_max(self):
+        return round((self.row_min + self.n_rows - 1) / CELLS_PER_DEGREE - 90, 1)
+
+    @property
+    def lon_min(self):
+        return round(self.col_min / CELLS_PER_DEGREE - 180, 1)
+
+    @property
+    def lon_max(self):
+        return round((int(self.col_starts.max()) + self.n_cols - 1) / CELLS_PER_DEGREE - 180, 1)
+
+    @property
+    def size(self):
+        return self.n_rows * self.n_cols
+
+    @property
+    def wraps(self):
+        """True if a factor-1 grid crosses the antimeridian, i.e. has global columns off the globe"""
+        return self.col_min < 0 or int(self.col_starts.max()) + self.n_cols > LON_CELLS
+
+    def cell(self, lat, lon):
+        """Local (row, col) of a coordinate, or None if it lies outside the grid"""
+        row = int(lat_to_row(lat)) // self.factor - self.row_min
+        if not 0 <= row < self.n_rows:
+            return None
+        # Modulo one turn around the globe, so the coordinate is found on either side of the antimeridian
+        col = (int(lon_to_col(lon)) // self.factor - int(self.col_starts[row])) % (LON_PERIOD // self.factor)
+        if col < self.n_cols:
+            return row, col
+        return None
+
+    def row_lats(self, rows):
+        """Centre latitude of local rows (scalar or array)"""
+        return ((self.row_min + rows) * self.factor + (self.factor - 1) / 2) / CELLS_PER_DEGREE - 90
+
+    def global_col_lons(self, global_cols):
+        """Centre longitude of global columns at this grid's resolution (scalar or array)"""
+        return (global_cols * self.factor + (self.factor - 1) / 2) / CELLS_PER_DEGREE - 180
+
+    def coords(self, row, col):
+        """(lat, lon) of a local cell's centre, longitude wrapped into [-180, 180]"""
+        return round(self.row_lats(row), 2), round(float(wrap_lon(self.global_col_lons(int(self.col_starts[row]) + col))), 2)
+
+    def has_weight(self, cell):
+        return not np.isnan(self.weights[cell])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; accepts scalars or NumPy arrays in degrees"""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def box_bounds(lats, lons, buffer=1.0):
+    """(row_min, col_min, n_rows, n_cols) of Grid.from_points' box, without building the grid"""
+    west, east = lon_cover(lons)
+    row_min = max(int(lat_to_row(min(lats) - buffer)), 0)
+    row_max = min(int(lat_to_row(max(lats) + buffer)), LAT_CELLS - 1)
+    # Columns past ±180° wrap around, so the buffer continues over the antimeridian
+    col_min = int(lon_to_col(west - buffer))
+    col_max = int(lon_to_col(east + buffer))
+    if col_max - col_min >= LON_PERIOD:
+        col_min, col_max = 0, LON_CELLS - 1
+    return row_min, col_min, row_max - row_min + 1, col_max - col_min + 1
+
+
+def lon_cover(lons):
+    """
+    (west, east) longitudes of the shortest arc containing all the longitudes:
+    the complement of the widest gap between neighbours around the globe. For
+    an arc across the antimeridian east is past 180°, e.g. (170, 190) for 170
+    and -170.
+    """
+    lons = sorted(lons)
+    gaps = np.diff(lons)
+    # The gap around the back of the globe wins ties, so the arc only wraps when that is shorter
+    if not len(gaps) or lons[0] + 360 - lons[-1] >= gaps.max():
+        return lons[0], lons[-1]
+    widest = int(np.argmax(gaps))
+    return lons[widest + 1], lons[widest] + 360
+
+
+def great_circle_points(lat1, lon1, lat2, lon2, n):
+    """n evenly spaced (lat, lon) points along the great circle between two points, endpoints included"""
+    def to_vector(lat, lon):
+        lat, lon = np.radians(lat), np.radians(lon)
+        return np.array([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+    a, b = to_vector(lat1, lon1), to_vector(lat2, lon2)
+    angle = np.arccos(np.clip(a @ b, -1.0, 1.0))
+    t = np.linspace(0.0, 1.0, max(n, 2))[:, None]
+    if angle < 1e-9:
+        points = np.repeat(a[None, :], len(t), axis=0)
+    else:
+        points = (np.sin((1 - t) * angle) * a + np.sin(t * angle) * b) / np.sin(angle)
+    lats = np.degrees(np.arcsin(np.clip(points[:, 2], -1.0, 1.0)))
+    lons = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+    return np.column_stack([lats, lons])
+
+
+def move_lengths(lats, step=STEP_SIZE):
+    """
+    Length in km of each move in NEIGHBOR_OFFSETS, per row latitude.
+
+    North-south steps are constant, east-west steps shrink with cos(lat) and
+    diagonals depend on the pair of rows they connect.
+    """
+    north_south = float(haversine_km(0.0, 0.0, step, 0.0))
+    east_west = haversine_km(lats, 0.0, lats, step)
+    diagonal_up = haversine_km(lats, 0.0, lats + step, step)
+    diagonal_down = haversine_km(lats, 0.0, lats - step, step)
+    return [
+        (north_south, north_south, float(ew), float(ew), float(up), float(down), float(up), float(down))
+        for ew, up, down in zip(east_west, diagonal_up, diagonal_down)
+    ]
+
+
+class SearchSpace:
+    """
+    Padded flat arrays for one search over a Grid.
+
+    Each row gets `pad` impassable cells on both sides (one more than the
+    largest shift between neighbouring rows' windows) and there is an
+    impassable row above and below, so neighbor indices never leave their row
+    and need no bounds checks. moves[row] lists (flat offset, length in km)
+    for every move in NEIGHBOR_OFFSETS out of that padded row.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        col_starts = np.concatenate(([grid.col_starts[0]], grid.col_starts, [grid.col_starts[-1]]))
+        shifts = np.diff(col_starts)
+        self.pad = int(np.abs(shifts).max()) + 1 if len(shifts) else 1
+        self.width = grid.n_cols + 2 * self.pad
+        shape = (grid.n_rows + 2, self.width)
+        interior = (slice(1, -1), slice(self.pad, self.pad + grid.n_cols))
+
+        self.shape = shape
+        self.interior = interior
+        self.cost = self.pad_cells(np.maximum(grid.weights, MIN_CELL_WEIGHT))
+        self.passable = self.pad_cells(~grid.land & ~np.isnan(grid.weights))
+
+        self.lats = grid.row_lats(np.arange(-1, shape[0] - 1))
+        # Longitude of every padded cell; rows of a corridor grid start at different columns
+        self.lons = grid.global_col_lons(col_starts[:, None] + np.arange(-self.pad, self.width - self.pad)[None, :])
+
+        lengths = move_lengths(self.lats, grid.step)
+        self.moves = [()]
+        for row in range(1, shape[0] - 1):
+            offsets = [dr * self.width + dc - int(col_starts[row + dr] - col_starts[row]) for dr, dc in NEIGHBOR_OFFSETS]
+            self.moves.append(tuple(zip(offsets, lengths[row])))
+        self.moves.append(())
+
+    def pad_cells(self, values, dtype=np.float64):
+        """Flat padded copy of an (n_rows, n_cols) array of the grid, zero (False) on the padding; floats become dtype"""
+        padded = np.zeros(self.shape, dtype=dtype if values.dtype.kind == "f" else values.dtype)
+        padded[self.interior] = values
+        return padded.ravel()
+
+    def index(self, cell):
+        """Flat index of a local (row, col) cell"""
+        return (cell[0] + 1) * self.width + cell[1] + self.pad
+
+    def coords(self, idx):
+        row, col = divmod(idx, self.width)
+        return self.grid.coords(row - 1, col - self.pad)
+
+    def min_weight(self):
+        return float(self.cost[self.passable].min()) if self.passable.any() else MIN_CELL_WEIGHT
+
+    def heuristic(self, cell, min_weight):
+        """
+        Flat array of great-circle distance to a cell times the smallest cell
+        weight. A path's length is at least the great-circle distance between
+        its ends and every step costs at least min_weight per km, so the
+        heuristic is admissible and consistent.
+        """
+        target_lat, target_lon = self.grid.coords(*cell)
+        return (haversine_km(self.lats[:, None], self.lons, target_lat, target_lon) * min_weight).ravel()
+
+
+def a_star_grid(grid, start, goal, deadline=None):
+    """
+    A* over a Grid between two local (row, col) cells.
+
+    Edge cost is the haversine length of the step times the weight of the cell
+    being entered, and the heuristic is SearchSpace.heuristic. Works on the
+    padded SearchSpace copy of the grid so neighbor lookups need no bounds
+    checks.
+
+    Returns a SearchResult whose path holds (lat, lon) tuples excluding the
+    start cell, or None if the goal is unreachable. Raises SearchTimeout once
+    time.time() passes deadline, if one is given.
+    """
+    space = SearchSpace(grid)
+    width, cost, passable, moves = space.width, space.cost, space.passable, space.moves
+
+    start_idx = space.index(start)
+    goal_idx = space.index(goal)
+    heuristic = space.heuristic(goal, space.min_weight())
+
+    g_score = np.full(cost.size, np.inf, dtype=np.float64)
+    came_from = np.full(cost.size, -1, dtype=np.int32)
+
+    g_score[start_idx] = 0.0
+    open_set = [(heuristic[start_idx], start_idx)]
+    pops = 0
+    expanded = 0
+
+    while open_set:
+        f, current = heapq.heappop(open_set)
+
+        pops += 1
+        if deadline is not None and pops % DEADLINE_CHECK_INTERVAL == 0 and time.time() > deadline:
+            raise SearchTimeout()
+
+        if current == goal_idx:
+            path = []
+            while current != start_idx:
+                path.append(space.coords(current))
+                current = int(came_from[current])
+            return SearchResult(path[::-1], float(g_score[goal_idx]), expanded)
+
+        current_g = g_score[current]
+        # Skip stale heap entries superseded by a cheaper path
+        if f > current_g + heuristic[current]:
+            continue
+        expanded += 1
+
+        for offset, length in moves[current // width]:
+            neighbor = current + offset
+            if not passable[neighbor]:
+                continue
+
+            tentative_g_score = current_g + length * cost[neighbor]
+            if tentative_g_score < g_score[neighbor]:
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g_score
+                heapq.heappush(open_set, (tentative_g_score + heuristic[neighbor], neighbor))
+
+    return SearchResult(None, None, expanded)
+
+
+def time_dependent_a_star_grid(grid, start, goal, forecast, start_hours, speed_kmh, step_hours, deadline=None):
+    """
+    A* between two local cells whose step costs follow the weather forecast.
+
+    forecast is a (steps, n_rows, n_cols) array of weights valid every
+    step_hours, and the vessel leaves start_hours after its first step. A
+    cell is entered at the time the vessel reaches it sailing speed_kmh
+    along the path so far, and costed with the forecast step nearest that
+    time: the last step past the forecast horizon, grid.weights for cells
+    without a forecast (NaN). Each step's padded costs are built as float32
+    on first use, so only the steps the search reaches cost memory.
+
+    The heuristic uses the smallest weight of any step, so it stays
+    admissible. Like other label-setting time-dependent searches, a cell is
+    settled once, by its cheapest path; a later, cheaper arrival through a
+    costlier path is not considered. Returns a SearchResult like a_star_grid.
+    """
+    if not len(forecast):
+        return a_star_grid(grid, start, goal, deadline)
+
+    space = SearchSpace(grid)
+    width, passable, moves = space.width, space.passable, space.moves
+
+    start_idx = space.index(start)
+    goal_idx = space.index(goal)
+    min_weight = space.min_weight()
+    # fmin skips NaN without the full-size copies of nanmin; NaN only if the forecast is all NaN
+    lowest = float(np.fmin.reduce(forecast, axis=None))
+    if not np.isnan(lowest):
+        min_weight = min(min_weight, max(lowest, MIN_CELL_WEIGHT))
+    heuristic = space.heuristic(goal, min_weight)
+
+    step_costs = [None] * len(forecast)
+    last_step = len(forecast) - 1
+    hours_per_km = 1 / speed_kmh
+
+    g_score = np.full(space.cost.size, np.inf, dtype=np.float64)
+    # Sailed distance in km along each cell's best path, which sets its arrival time
+    travelled = np.zeros(space.cost.size, dtype=np.float64)
+    came_from = np.full(space.cost.size, -1, dtype=np.int32)
+
+    g_score[start_idx] = 0.0
+    open_set = [(heuristic[start_idx], start_idx)]
+    pops = 0
+    expanded = 0
+
+    while open_set:
+        f, current = heapq.heappop(open_set)
+
+        pops += 1
+        if deadline is not None and pops % DEADLINE_CHECK_INTERVAL == 0 and time.time() > deadline:
+            raise SearchTimeout()
+
+        if current == goal_idx:
+            path = []
+            while current != start_idx:
+                path.append(space.coords(current))
+                current = int(came_from[current])
+            return SearchResult(path[::-1], float(g_score[goal_idx]), expanded)
+
+        current_g = g_score[current]
+        # Skip stale heap entries superseded by a cheaper path
+        if f > current_g + heuristic[current]:
+            continue
+        expanded += 1
+
+        # A step takes well under a forecast step, so all neighbours use the step the vessel leaves current in
+        current_distance = travelled[current]
+        step = min(int((start_hours + current_distance * hours_per_km) / step_hours + 0.5), last_step)
+        cost = step_costs[step]
+        if cost is None:
+            values = forecast[step].astype(np.float32)
+            weights = np.where(np.isnan(values), grid.weights, values)
+            cost = step_costs[step] = space.pad_cells(np.maximum(weights, MIN_CELL_WEIGHT), np.float32)
+
+        for offset, length in moves[current // width]:
+            neighbor = current + offset
+            if not passable[neighbor]:
+                continue
+
+            # float() keeps the sum in double precision (and is faster than float32 scalar arithmetic)
+            tentative_g_score = current_g + length * float(cost[neighbor])
+            if tentative_g_score < g_score[neighbor]:
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g_score
+                travelled[neighbor] = current_distance + length
+                heapq.heappush(open_set, (tentative_g_score + heuristic[neighbor], neighbor))
+
+    return SearchResult(None, None, expanded)
+
+
+def multi_target_a_star_grid(grid, start, goals, deadline=None):
+    """
+    One search from start to several local (row, col) goal cells.
+
+    Uses the smallest of the goals' SearchSpace heuristics, which is still
+    consistent, so every expanded cell has its final cost and the search
+    simply continues until every goal is expanded or the queue runs dry.
+    With many goals it degrades gracefully into Dijkstra over the grid;
+    either way it costs about one a_star_grid search to the farthest goal
+    instead of one search per goal.
+
+    Returns one SearchResult per goal, in order; each shares the total
+    expansion count.
+    """
+    space = SearchSpace(grid)
+    width, cost, passable, moves = space.width, space.cost, space.passable, space.moves
+
+    start_idx = space.index(start)
+    goal_indices = [space.index(goal) for goal in goals]
+    min_weight = space.min_weight()
+    heuristic = space.heuristic(goals[0], min_weight)
+    for goal in dict.fromkeys(goals[1:]):
+        np.minimum(heuristic, space.heuristic(goal, min_weight), out=heuristic)
+
+    g_score = np.full(cost.size, np.inf, dtype=np.float64)
+    came_from = np.full(cost.size, -1, dtype=np.int32)
+
+    g_score[start_idx] = 0.0
+    open_set = [(heuristic[start_idx], start_idx)]
+    # Goals on land or without weather data can never be expanded; don't search the whole grid for them
+    remaining = {goal_idx for goal_idx in goal_indices if passable[goal_idx] or goal_idx == start_idx}
+    pops = 0
+    expanded = 0
+
+    while open_set and remaining:
+        f, current = heapq.heappop(open_set)
+
+        pops += 1
+        if deadline is not None and pops % DEADLINE_CHECK_INTERVAL == 0 and time.time() > deadline:
+            raise SearchTimeout()
+
+        current_g = g_score[current]
+        # Skip stale heap entries superseded by a cheaper path
+        if f > current_g + heuristic[current]:
+            continue
+        expanded += 1
+        remaining.discard(current)
+
+        for offset, length in moves[current // width]:
+            neighbor = current + offset
+            if not passable[neighbor]:
+                continue
+
+            tentative_g_score = current_g + length * cost[neighbor]
+            if tentative_g_score < g_score[neighbor]:
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g_score
+                heapq.heappush(open_set, (tentative_g_score + heuristic[neighbor], neighbor))
+
+    results = []
+    for goal_idx in goal_indices:
+        if not np.isfinite(g_score[goal_idx]):
+            results.append(SearchResult(None, None, expanded))
+            continue
+        path = []
+        current = goal_idx
+        while current != start_idx:
+            path.append(space.coords(current))
+            current = int(came_from[current])
+        results.append(SearchResult(path[::-1], float(g_score[goal_idx]), expanded))
+    return results
+
+
+def bidirectional_a_star_grid(grid, start, goal, deadline=None):
+    """
+    Bidirectional A* with average potentials between two local cells.
+
+    The forward search uses p(v) = (h_goal(v) - h_start(v)) / 2 and the
+    reverse search -p(v); both are consistent, so each side is Dijkstra on
+    the same reduced costs and the search can stop as soon as the two queue
+    minima add up to the best meeting cost found. Because edge costs depend
+    on the cell being entered, the reverse search charges the weight of the
+    cell it expands. Same cost model and result as a_star_grid, typically
+    with far fewer expansions on long routes.
+    """
+    space = SearchSpace(grid)
+    width, cost, passable, moves = space.width, space.cost, space.passable, space.moves
+
+    start_idx = space.index(start)
+    goal_idx = space.index(goal)
+    if not passable[goal_idx]:
+        return SearchResult(None, None, 0)
+
+    min_weight = space.min_weight()
+    potential = (space.heuristic(goal, min_weight) - space.heuristic(start, min_weight)) / 2
+
+    g_forward = np.full(cost.size, np.inf, dtype=np.float64)
+    g_reverse = np.full(cost.size, np.inf, dtype=np.float64)
+    came_from = np.full(cost.size, -1, dtype=np.int32)
+    goes_to = np.full(cost.size, -1, dtype=np.int32)
+
+    g_forward[start_idx] = 0.0
+    g_reverse[goal_idx] = 0.0
+    forward_set = [(potential[start_idx], start_idx)]
+    reverse_set = [(-potential[goal_idx], goal_idx)]
+    best_cost = np.inf
+    meeting = -1
+    pops = 0
+    expanded = 0
+
+    while forward_set and reverse_set:
+        if forward_set[0][0] + reverse_set[0][0] >= best_cost:
+            break
+
+        pops += 1
+        if deadline is not None and pops % DEADLINE_CHECK_INTERVAL == 0 and time.time() > deadline:
+            raise SearchTimeout()
+
+        if forward_set[0][0] <= reverse_set[0][0]:
+            key, current = heapq.heappop(forward_set)
+            current_g = g_forward[current]
+            if key > current_g + potential[current]:
+                continue
+            expanded += 1
+
+            for offset, length in moves[current // width]:
+                neighbor = current + offset
+                if not passable[neighbor]:
+                    continue
+
+                tentative_g_score = current_g + length * cost[neighbor]
+                if tentative_g_score < g_forward[neighbor]:
+                    came_from[neighbor] = current
+                    g_forward[neighbor] = tentative_g_score
+                    heapq.heappush(forward_set, (tentative_g_score + potential[neighbor], neighbor))
+                    if tentative_g_score + g_reverse[neighbor] < best_cost:
+                        best_cost = tentative_g_score + g_reverse[neighbor]
+                        meeting = neighbor
+        else:
+            key, current = heapq.heappop(reverse_set)
+            current_g = g_reverse[current]
+            if key > current_g - potential[current] or current == start_idx:
+                continue
+            expanded += 1
+
+            # Every edge into current costs the weight of current
+            current_cost = cost[current]
+            for offset, length in moves[current // width]:
+                neighbor = current + offset
+                if not passable[neighbor] and neighbor != start_idx:
+                    continue
+
+                tentative_g_score = current_g + length * current_cost
+                if tentative_g_score < g_reverse[neighbor]:
+                    goes_to[neighbor] = current
+                    g_reverse[neighbor] = tentative_g_score
+                    heapq.heappush(reverse_set, (tentative_g_score - potential[neighbor], neighbor))
+                    if g_forward[neighbor] + tentative_g_score < best_cost:
+                        best_cost = g_forward[neighbor] + tentative_g_score
+                        meeting = neighbor
+
+    if meeting < 0:
+        return SearchResult(None, None, expanded)
+
+    path = []
+    current = meeting
+    while current != start_idx:
+        path.append(current)
+        current = int(came_from[current])
+    path.reverse()
+    current = meeting
+    while current != goal_idx:
+        current = int(goes_to[current])
+        path.append(current)
+
+    return SearchResult([space.coords(idx) for idx in path], float(best_cost), expanded)
+
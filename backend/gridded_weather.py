@@ -0,0 +1,321 @@
+"""
+Weather ingestion from gridded GRIB2 / NetCDF files.
+
+The HTTP refresh asks the weather API for one 0.1° cell at a time, about
+6.5M requests for the globe. Weather models publish the same fields as
+gridded files (GFS and ECMWF as GRIB2, ERA5 and many others as NetCDF), so
+this backend reads every file in a local directory instead:
+
+    files -> fields on their source grids -> bilinear regrid onto the sea cells
+          -> calculate_grid_weights -> weather_data
+
+Each field is decoded as a whole NumPy array. The selected sea cells (see
+ocean_cells) are processed in chunks: every field is interpolated onto the
+chunk in one vectorized pass and the chunk is weighted with one
+calculate_grid_weights call. Rows go through the same bulk writer as the
+HTTP refresh (weather_writer), and the refresh is published as a weather
+version. --incremental only rewrites cells whose weight changed.
+
+Fields are found by their usual short names and converted to the units of
+the current-weather API: 10 m wind (si10, or u10/v10 components; m/s),
+gusts (gust, i10fg, fg10; m/s), 2 m temperature (t2m; K -> °C), visibility
+(vis; m), mean sea level pressure (msl, prmsl; Pa -> hPa) and 2 m relative
+humidity (r2, rh2m; %). A field missing from every file gets
+parse_weather_data's default. Of a field with several time steps or
+levels, the first is used.
+
+Reading needs xarray, plus cfgrib (with ecCodes) for GRIB2 or netCDF4 for
+NetCDF. They are only imported when files are read.
+
+GRIDDED_WEATHER_DIR sets the directory (default data/gridded).
+
+Usage:
+    python gridded_weather.py [--dir PATH] [--regions a,b] [--incremental] [--tolerance T]
+    python gridded_weather.py --dir PATH --write-sample   # small ERA5-style NetCDF to try it with
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+import numpy as np
+import database
+from fetch_weather import WEATHER_DTYPE, calculate_grid_weights
+from ocean_cells import INGEST_REGIONS, cell_coordinates, parse_region_names, region_bounds, select_ocean_cells
+from store_update_weather import (WEATHER_CHANGE_TOLERANCE, create_pool, region_tiles, store_changed_weights,
+                                  store_weather_data_batch)
+from weather_pipeline import INGEST_DB_WRITERS
+from weather_version import record_refresh
+
+GRIDDED_WEATHER_DIR = os.getenv(
+    "GRIDDED_WEATHER_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gridded")
+)
+
+GRIB_SUFFIXES = (".grib2", ".grb2", ".grib", ".grb")
+NETCDF_SUFFIXES = (".nc", ".nc4", ".netcdf")
+
+# Sea cells regridded and weighted at a time
+GRIDDED_CHUNK_CELLS = 100000
+
+# Source variable names of each field, in order of preference
+SOURCE_VARIABLES = {
+    "wind_speed": ("si10", "ws10", "wind"),
+    "wind_u": ("u10", "10u"),
+    "wind_v": ("v10", "10v"),
+    "wind_gust": ("gust", "i10fg", "fg10"),
+    "temperature": ("t2m", "2t", "tmp2m"),
+    "visibility": ("vis",),
+    "pressure": ("msl", "prmsl"),
+    "humidity": ("r2", "rh2m", "2r"),
+}
+
+# Same defaults as parse_weather_data uses for fields missing from an API response
+FIELD_DEFAULTS = {
+    "wind_speed": 0,
+    "wind_gust": 0,
+    "temperature": 0,
+    "visibility": 10000,
+    "pressure": 0,
+    "humidity": 50,
+}
+
+# Conversions from source units to the API's metric units
+UNIT_CONVERSIONS = {
+    "K": lambda values: values - 273.15,
+    "Pa": lambda values: values / 100,
+}
+
+LAT_NAMES = ("latitude", "lat")
+LON_NAMES = ("longitude", "lon")
+
+
+def open_datasets(path):
+    """xarray datasets of a gridded file; a GRIB2 file gives one per level type"""
+    try:
+        import xarray
+    except ImportError:
+        raise ImportError("Reading gridded weather files needs xarray: pip install xarray cfgrib netCDF4")
+    if path.lower().endswith(GRIB_SUFFIXES):
+        try:
+            import cfgrib
+        except ImportError:
+            raise ImportError("Reading GRIB2 files needs cfgrib and ecCodes: pip install cfgrib")
+        return cfgrib.open_datasets(path)
+    return [xarray.open_dataset(path)]
+
+
+def field_grid(variable):
+    """
+    (lats, lons, values) of an xarray variable on a regular latitude/longitude
+    grid: 1-D axes and a 2-D float64 array, converted to metric API units.
+    Other dimensions (time, step, level) are reduced to their first entry.
+    """
+    lat_name = next((name for name in LAT_NAMES if name in variable.dims), None)
+    lon_name = next((name for name in LON_NAMES if name in variable.dims), None)
+    if lat_name is None or lon_name is None:
+        raise ValueError(f"{variable.name} is not on a regular latitude/longitude grid (dims {variable.dims})")
+
+    variable = variable.isel({dim: 0 for dim in variable.dims if dim not in (lat_name, lon_name)})
+    values = np.asarray(variable.transpose(lat_name, lon_name).values, dtype=np.float64)
+    convert = UNIT_CONVERSIONS.get(variable.attrs.get("units"))
+    if convert:
+        values = convert(values)
+    return np.asarray(variable[lat_name], dtype=np.float64), np.asarray(variable[lon_name], dtype=np.float64), values
+
+
+def read_fields(directory=GRIDDED_WEATHER_DIR):
+    """
+    Fields found in the gridded files of a directory: field name -> (lats,
+    lons, values). Files are read in name order and the first file holding a
+    field provides it.
+    """
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(GRIB_SUFFIXES + NETCDF_SUFFIXES)
+    )
+    if not paths:
+        raise FileNotFoundError(f"No GRIB2 or NetCDF files in {directory}")
+
+    fields = {}
+    for path in paths:
+        for dataset in open_datasets(path):
+            with dataset:
+                for field, names in SOURCE_VARIABLES.items():
+                    name = next((name for name in names if name in dataset.data_vars), None)
+                    if field not in fields and name is not None:
+                        fields[field] = field_grid(dataset[name])
+                        print(f"{field}: {name} from {os.path.basename(path)}")
+    return fields
+
+
+def sample_dataset(lat_min=0, lat_max=30, lon_min=40, lon_max=100, step=0.25):
+    """
+    Small xarray dataset laid out like ERA5 NetCDF output, for trying the
+    backend without model files: descending latitudes, 0-360 longitudes, a
+    valid_time dimension and SI units (K, Pa). It holds 10 m wind
+    components, gusts, 2 m temperature and sea level pressure around a storm
+    centred in the box; humidity and visibility are left to their defaults.
+    """
+    import xarray
+
+    lats = np.arange(lat_max, lat_min - step / 2, -step)
+    lons = np.mod(np.arange(lon_min, lon_max + step / 2, step), 360)
+    lat_grid, lon_grid = np.meshgrid(lats, np.arange(lon_min, lon_max + step / 2, step), indexing="ij")
+    # Gaussian storm, 5° across, in the middle of the box
+    storm = np.exp(-((lat_grid - (lat_min + lat_max) / 2) ** 2 + (lon_grid - (lon_min + lon_max) / 2) ** 2) / 25)
+
+    def field(values, units):
+        return ("valid_time", "latitude", "longitude"), values[None].astype(np.float32), {"units": units}
+
+    return xarray.Dataset(
+        {
+            "u10": field(3 + 15 * storm, "m s**-1"),
+            "v10": field(4 + 10 * storm, "m s**-1"),
+            "i10fg": field(5 + 25 * storm, "m s**-1"),
+            "t2m": field(300 - 5 * storm, "K"),
+            "msl": field(101300 - 3000 * storm, "Pa"),
+        },
+        coords={"valid_time": [np.datetime64("2024-01-01T00:00")], "latitude": lats, "longitude": lons},
+    )
+
+
+def regrid(lats, lons, values, cell_lats, cell_lons):
+    """
+    Bilinear interpolation of a latitude/longitude field at the given points.
+
+    Axes may run in either direction and be unevenly spaced (e.g. Gaussian
+    latitudes); longitudes may be given in [0, 360). A field covering every
+    longitude wraps around. Corners without data (NaN) are left out of the
+    average; points with no data at any corner, or off the field, are NaN.
+    """
+    if lats[0] > lats[-1]:
+        lats, values = lats[::-1], values[::-1]
+    lons = np.mod(lons + 180, 360) - 180
+    order = np.argsort(lons, kind="stable")
+    lons, values = lons[order], values[:, order]
+    cell_lons = np.asarray(cell_lons, dtype=np.float64)
+    if lons[-1] - lons[0] + np.diff(lons).max() >= 360 - 1e-6:
+        # Global field: close the gap between the last and the first column
+        lons = np.append(lons, lons[0] + 360)
+        values = np.concatenate([values, values[:, :1]], axis=1)
+        cell_lons = np.where(cell_lons < lons[0], cell_lons + 360, cell_lons)
+
+    # Fractional source indices of every point
+    rows = np.interp(cell_lats, lats, np.arange(len(lats)), left=np.nan, right=np.nan)
+    cols = np.interp(cell_lons, lons, np.arange(len(lons)), left=np.nan, right=np.nan)
+    inside = ~np.isnan(rows) & ~np.isnan(cols)
+    rows, cols = np.where(inside, rows, 0), np.where(inside, cols, 0)
+    row0 = np.minimum(rows.astype(np.int64), len(lats) - 2)
+    col0 = np.minimum(cols.astype(np.int64), len(lons) - 2)
+    row_frac, col_frac = rows - row0, cols - col0
+
+    corners = np.stack([values[row0, col0], values[row0, col0 + 1], values[row0 + 1, col0], values[row0 + 1, col0 + 1]])
+    weights = np.stack([(1 - row_frac) * (1 - col_frac), (1 - row_frac) * col_frac,
+                        row_frac * (1 - col_frac), row_frac * col_frac])
+    # The small bias keeps a point sitting on a missing corner from losing its other corners
+    weights = np.where(np.isnan(corners), 0, weights + 1e-9)
+    totals = weights.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = (weights * np.nan_to_num(corners)).sum(axis=0) / totals
+    return np.where(inside & (totals > 0), result, np.nan)
+
+
+def cell_weather(fields, cell_lats, cell_lons):
+    """Structured WEATHER_DTYPE array of the fields interpolated at the given cells, with defaults where missing"""
+    def field_values(field):
+        if field not in fields:
+            return None
+        return regrid(*fields[field], cell_lats, cell_lons)
+
+    weather = np.empty(len(cell_lats), dtype=WEATHER_DTYPE)
+    wind_speed = field_values("wind_speed")
+    if wind_speed is None and "wind_u" in fields and "wind_v" in fields:
+        wind_speed = np.hypot(field_values("wind_u"), field_values("wind_v"))
+    weather["wind_speed"] = FIELD_DEFAULTS["wind_speed"] if wind_speed is None else wind_speed
+    for field in ("wind_gust", "temperature", "visibility", "pressure", "humidity"):
+        values = field_values(field)
+        weather[field] = FIELD_DEFAULTS[field] if values is None else values
+    # Cells the files don't cover at all get the defaults too
+    for field, default in FIELD_DEFAULTS.items():
+        np.copyto(weather[field], default, where=np.isnan(weather[field]))
+    return weather
+
+
+async def ingest_fields(pool, fields, regions=None, incremental=False, tolerance=WEATHER_CHANGE_TOLERANCE):
+    """
+    Weight the sea cells of the given boxes (default: the globe) from the fields
+    and write them to weather_data, INGEST_DB_WRITERS writes at a time.
+    Returns (cells written, tiles rewritten by an incremental run).
+    """
+    cells = select_ocean_cells(regions)
+    changed_tiles = set()
+    written = 0
+    print(f"Weighting {len(cells)} sea cells from {len(fields)} gridded fields")
+
+    for start in range(0, len(cells), GRIDDED_CHUNK_CELLS):
+        lats, lons = cell_coordinates(cells[start:start + GRIDDED_CHUNK_CELLS])
+        weights = calculate_grid_weights(cell_weather(fields, lats, lons))
+        now = datetime.now()
+        results = list(zip(lats.tolist(), lons.tolist(), weights.tolist(), [now] * len(lats)))
+
+        # Cell order is row-major, so each writer's share covers a few neighbouring rows
+        shares = [
+            results[i * len(results) // INGEST_DB_WRITERS:(i + 1) * len(results) // INGEST_DB_WRITERS]
+            for i in range(INGEST_DB_WRITERS)
+        ]
+        if incremental:
+            counts = await asyncio.gather(*(store_changed_weights(pool, share, tolerance, changed_tiles)
+                                            for share in shares if share))
+        else:
+            counts = await asyncio.gather(*(store_weather_data_batch(pool, share) for share in shares if share))
+        written += sum(counts)
+        print(f"Gridded ingestion: {min(start + GRIDDED_CHUNK_CELLS, len(cells))}/{len(cells)} cells, {written} written")
+
+    return written, changed_tiles
+
+
+async def main(directory=GRIDDED_WEATHER_DIR, region_names=INGEST_REGIONS, incremental=False,
+               tolerance=WEATHER_CHANGE_TOLERANCE):
+    start_time = time.time()
+    started_at = datetime.now()
+    fields = read_fields(directory)
+    print(f"Decoded {len(fields)} fields in {time.time() - start_time:.2f} seconds")
+
+    regions = region_bounds(region_names)
+    if region_names:
+        print(f"Limiting ingestion to {', '.join(region_names)}")
+    pool = await create_pool()
+    try:
+        written, changed_tiles = await ingest_fields(pool, fields, regions, incremental, tolerance)
+        if not incremental:
+            # A full run rewrote every cell it covered: the whole globe, or the selected regions
+            changed_tiles = region_tiles(regions) if regions else None
+        version = await record_refresh(pool, started_at, datetime.now(), changed_tiles)
+        print(f"Published weather version {version} ({written} cells written)")
+    finally:
+        await database.close_pool(pool)
+    print(f"Total processing time: {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh weather_data from gridded GRIB2 / NetCDF files")
+    parser.add_argument("--dir", default=GRIDDED_WEATHER_DIR,
+                        help="directory of GRIB2 / NetCDF files (default: GRIDDED_WEATHER_DIR)")
+    parser.add_argument("--regions", default=",".join(INGEST_REGIONS),
+                        help="comma-separated operating regions to refresh (default: INGEST_REGIONS, or the whole globe)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only rewrite cells whose weight changed")
+    parser.add_argument("--tolerance", type=float, default=WEATHER_CHANGE_TOLERANCE,
+                        help="minimum weight change rewritten by --incremental")
+    parser.add_argument("--write-sample", action="store_true",
+                        help="write a small ERA5-style NetCDF sample (see sample_dataset) into the directory and exit")
+    args = parser.parse_args()
+    if args.write_sample:
+        os.makedirs(args.dir, exist_ok=True)
+        sample_dataset().to_netcdf(os.path.join(args.dir, "sample.nc"))
+        print(f"Wrote {os.path.join(args.dir, 'sample.nc')}")
+        raise SystemExit(0)
+    region_names = parse_region_names(args.regions)
+    asyncio.run(main(args.dir, region_names, args.incremental, args.tolerance))
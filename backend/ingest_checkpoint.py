@@ -0,0 +1,123 @@
+"""
+Checkpoints for long weather refreshes.
+
+A refresh walks the sorted ocean cell list (see ocean_cells) in chunks of
+fixed size. For each part of the run (the selected regions, or one region
+of a by-region run) the checkpoint file records which chunks are finished,
+meaning every cell was written or its fetch was given up on. Incremental
+runs also record the weight tiles rewritten so far. The file is a small
+JSON document replaced atomically whenever a chunk finishes.
+
+``store_update_weather.py --resume`` reloads it and streams only the
+unfinished chunks, so a crash or timeout loses at most the chunks that were
+in flight rather than the hours already fetched. The file is removed once
+the refresh is published as a weather version.
+
+INGEST_CHECKPOINT_PATH sets the file (default data/ingest_checkpoint.json).
+"""
+
+import json
+import os
+import time
+import numpy as np
+from land_mask import LON_CELLS, lat_to_row, lon_to_col
+
+INGEST_CHECKPOINT_PATH = os.getenv(
+    "INGEST_CHECKPOINT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ingest_checkpoint.json")
+)
+
+
+class IngestCheckpoint:
+    """Finished chunks per part of one refresh run, persisted to a JSON file"""
+
+    def __init__(self, settings, path=INGEST_CHECKPOINT_PATH, started_at=None, parts=None, changed_tiles=()):
+        self.settings = settings
+        self.path = path
+        self.started_at = started_at or time.time()
+        # part name -> {"cells": number of cells in the part, "chunks": set of finished chunks}
+        self.parts = parts or {}
+        self.changed_tiles = {tuple(tile) for tile in changed_tiles}
+
+    @classmethod
+    def load(cls, path=INGEST_CHECKPOINT_PATH):
+        """The checkpoint saved at path, or None if there is none"""
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            state = json.load(f)
+        parts = {
+            name: {"cells": part["cells"], "chunks": set(part["chunks"])}
+            for name, part in state["parts"].items()
+        }
+        return cls(state["settings"], path, state["started_at"], parts, state["changed_tiles"])
+
+    def finished_chunks(self, part, cell_count):
+        """
+        The set of finished chunks of a part, updated in place as chunks finish.
+        Starts the part over if its cell list changed since the checkpoint was taken.
+        """
+        state = self.parts.get(part)
+        if state is None or state["cells"] != cell_count:
+            if state is not None:
+                print(f"Ocean cells of {part} changed since the checkpoint, refreshing it from the start")
+            state = self.parts[part] = {"cells": cell_count, "chunks": set()}
+        return state["chunks"]
+
+    def save(self):
+        state = {
+            "settings": self.settings,
+            "started_at": self.started_at,
+            "parts": {
+                name: {"cells": part["cells"], "chunks": sorted(part["chunks"])}
+                for name, part in self.parts.items()
+            },
+            "changed_tiles": sorted(self.changed_tiles)
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ChunkProgress:
+    """Tracks the in-flight chunks of one part and checkpoints each one as it finishes"""
+
+    def __init__(self, checkpoint, part, cells, chunk_size):
+        self.checkpoint = checkpoint
+        self.cells = np.asarray(cells, dtype=np.int64)
+        self.chunk_size = chunk_size
+        self.finished = checkpoint.finished_chunks(part, len(self.cells))
+        self.remaining = {}
+
+    @property
+    def chunk_count(self):
+        return -(-len(self.cells) // self.chunk_size)
+
+    def pending_chunks(self):
+        return [chunk for chunk in range(self.chunk_count) if chunk not in self.finished]
+
+    def chunk_cells(self, chunk):
+        return self.cells[chunk * self.chunk_size:(chunk + 1) * self.chunk_size]
+
+    def done(self, coordinates):
+        """Count (lat, lon) of this part as finished; saves the checkpoint when a chunk completes"""
+        lats, lons = zip(*coordinates)
+        flat = lat_to_row(lats) * LON_CELLS + lon_to_col(lons)
+        chunks, counts = np.unique(np.searchsorted(self.cells, flat) // self.chunk_size, return_counts=True)
+
+        completed = False
+        for chunk, count in zip(chunks.tolist(), counts.tolist()):
+            left = self.remaining.pop(chunk, len(self.chunk_cells(chunk))) - count
+            if left > 0:
+                self.remaining[chunk] = left
+            else:
+                self.finished.add(chunk)
+                completed = True
+        if completed:
+            self.checkpoint.save()
@@ -0,0 +1,144 @@
+"""
+Precomputed land/sea bitmap on the 0.1° routing grid.
+
+On-disk format: a NumPy ``.npy`` file holding a (1801, 3601) uint8 array.
+Row ``i`` is latitude ``-90 + i * 0.1`` and column ``j`` is longitude
+``-180 + j * 0.1``; a value of 1 means land and 0 means sea. The file is
+memory-mapped, so it is loaded once per process and shared between workers
+through the page cache.
+
+Build it with ``python build_land_mask.py``. If the file is missing the mask is
+built in memory from global_land_mask on first use.
+"""
+
+import os
+import numpy as np
+from global_land_mask import globe
+
+STEP_SIZE = 0.1
+CELLS_PER_DEGREE = 10
+LAT_CELLS = 180 * CELLS_PER_DEGREE + 1
+LON_CELLS = 360 * CELLS_PER_DEGREE + 1
+# Columns once around the globe; column LON_CELLS - 1 (180°) is the same meridian as column 0 (-180°)
+LON_PERIOD = 360 * CELLS_PER_DEGREE
+
+LAND_MASK_PATH = os.getenv(
+    "LAND_MASK_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "land_mask_0p1.npy")
+)
+
+
+def lat_to_row(lat):
+    """Row index of a latitude (scalar or array) on the 0.1° grid"""
+    return np.rint((np.asarray(lat, dtype=np.float64) + 90) * CELLS_PER_DEGREE).astype(np.int64)
+
+
+def lon_to_col(lon):
+    """Column index of a longitude (scalar or array) on the 0.1° grid"""
+    return np.rint((np.asarray(lon, dtype=np.float64) + 180) * CELLS_PER_DEGREE).astype(np.int64)
+
+
+def wrap_col(cols):
+    """Global columns (scalar or array) past either end of the globe wrapped back onto it"""
+    cols = np.asarray(cols, dtype=np.int64)
+    return np.where((cols < 0) | (cols >= LON_CELLS), cols % LON_PERIOD, cols)
+
+
+def wrap_lon(lon):
+    """Longitudes (scalar or array) past ±180° wrapped back into [-180, 180)"""
+    lon = np.asarray(lon, dtype=np.float64)
+    return np.where(np.abs(lon) > 180, (lon + 180) % 360 - 180, lon)
+
+
+def grid_coordinates(lat_min, lat_max, lon_min, lon_max):
+    """
+    Flat (lats, lons) arrays of every 0.1° cell centre in a box, row-major and
+    clipped to the globe's latitudes. Longitudes past ±180° wrap around, so
+    lon_max may exceed 180 for a box across the antimeridian. Built from
+    integer cell indices, so values are exact one-decimal coordinates
+    without per-point rounding.
+    """
+    rows = np.arange(max(int(lat_to_row(lat_min)), 0), min(int(lat_to_row(lat_max)), LAT_CELLS - 1) + 1)
+    col_min, col_max = int(lon_to_col(lon_min)), int(lon_to_col(lon_max))
+    if col_max - col_min >= LON_PERIOD:
+        cols = np.arange(LON_CELLS)
+    else:
+        cols = wrap_col(np.arange(col_min, col_max + 1))
+    row_grid, col_grid = np.meshgrid(rows, cols, indexing="ij")
+    lats = np.round(row_grid.ravel() / CELLS_PER_DEGREE - 90, 1)
+    lons = np.round(col_grid.ravel() / CELLS_PER_DEGREE - 180, 1)
+    return lats, lons
+
+
+def to_cell(value):
+    """Integer cell coordinate (degrees * 10), as stored in weather_data.lat_i / lon_i"""
+    return int(round(float(value) * CELLS_PER_DEGREE))
+
+
+def build_land_mask():
+    """Rasterize global_land_mask onto the 0.1° grid, one latitude row at a time"""
+    lons = np.round(np.linspace(-180, 180, LON_CELLS), 1)
+    mask = np.empty((LAT_CELLS, LON_CELLS), dtype=np.uint8)
+    for row in range(LAT_CELLS):
+        lat = round(-90 + row * STEP_SIZE, 1)
+        mask[row] = globe.is_land(np.full(LON_CELLS, lat), lons)
+    return mask
+
+
+def save_land_mask(mask, path=LAND_MASK_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.save(path, mask.astype(np.uint8, copy=False))
+
+
+class LandMask:
+    """O(1) land lookups backed by a (memory-mapped) 0.1° bitmap"""
+
+    def __init__(self, mask):
+        if mask.shape != (LAT_CELLS, LON_CELLS):
+            raise ValueError(f"Land mask has shape {mask.shape}, expected {(LAT_CELLS, LON_CELLS)}")
+        self.mask = mask
+
+    @classmethod
+    def load(cls, path=LAND_MASK_PATH):
+        if os.path.exists(path):
+            return cls(np.load(path, mmap_mode="r"))
+        print(f"Land mask file not found at {path}, building in memory (run build_land_mask.py)")
+        return cls(build_land_mask())
+
+    def is_land(self, lat, lon):
+        """Scalar lookup for a single coordinate"""
+        row = int(round((lat + 90) * CELLS_PER_DEGREE))
+        col = int(round((lon + 180) * CELLS_PER_DEGREE))
+        return bool(self.mask[row, col])
+
+    def is_land_many(self, lats, lons):
+        """Vectorized lookup for arrays of coordinates"""
+        return self.mask[lat_to_row(lats), lon_to_col(lons)].astype(bool)
+
+    def box(self, lat_min, lat_max, lon_min, lon_max):
+        """Boolean land array for a bounding box, rows by latitude and columns by longitude"""
+        row_min, row_max = int(lat_to_row(lat_min)), int(lat_to_row(lat_max))
+        col_min, col_max = int(lon_to_col(lon_min)), int(lon_to_col(lon_max))
+        return np.asarray(self.mask[row_min:row_max + 1, col_min:col_max + 1], dtype=bool)
+
+    def windows(self, row_min, col_starts, n_cols):
+        """
+        Boolean land array for consecutive rows starting at row_min, each row
+        n_cols wide starting at its own column. Columns past either end of
+        the globe wrap around the antimeridian.
+        """
+        col_starts = np.asarray(col_starts, dtype=np.int64)
+        rows = np.arange(row_min, row_min + len(col_starts))[:, None]
+        cols = wrap_col(col_starts[:, None] + np.arange(n_cols)[None, :])
+        return np.asarray(self.mask[rows, cols], dtype=bool)
+
+
+_land_mask = None
+
+
+def get_land_mask():
+    """Process-wide land mask, loaded on first use"""
+    global _land_mask
+    if _land_mask is None:
+        _land_mask = LandMask.load()
+    return _land_mask
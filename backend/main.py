@@ -1,15 +1,47 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import os
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-from typing import List, Optional
-from astar_weather import get_path
+from fastapi.responses import HTMLResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import List, Literal, Optional
+from astar_weather import get_path_cached, get_paths_batch, get_paths_to_targets
+from database import close_pool, create_pool
+from land_mask import get_land_mask
+from route_cache import route_cache
+from route_executor import ExecutorSaturated, RouteExecutor, RouteTimeout
+from weather_forecast import ensure_forecast_table
+from weather_version import ensure_refresh_tables
+
+# Most routes accepted by one /api/route/batch request
+ROUTE_BATCH_MAX = int(os.getenv("ROUTE_BATCH_MAX", "100"))
+# Most targets accepted by one /api/route/one-to-many request
+ROUTE_TARGETS_MAX = int(os.getenv("ROUTE_TARGETS_MAX", "20"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the land/sea bitmap once so the first route request doesn't pay for it
+    get_land_mask()
+    # Shared connection pool; autocommit so pooled connections never read from a stale snapshot
+    app.state.db_pool = await create_pool(autocommit=True)
+    # Route results are cached per weather version, read from weather_refresh
+    await ensure_refresh_tables(app.state.db_pool)
+    # Forecast slices for routes with a departure time, filled by store_update_forecast.py
+    await ensure_forecast_table(app.state.db_pool)
+    # A* runs in a worker pool so long routes don't block the event loop
+    app.state.route_executor = RouteExecutor()
+    yield
+    app.state.route_executor.shutdown()
+    await close_pool(app.state.db_pool)
 
 app = FastAPI(
     title="AquaIntel API",
     description="Maritime route optimization with A* pathfinding and weather data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS - Already good, but let's be more specific for production
@@ -37,12 +69,49 @@ class RouteRequest(BaseModel):
     start_longitude: float
     end_latitude: float
     end_longitude: float
+    # "bidirectional" searches from both ends; same path cost, fewer expansions on long voyages.
+    # "hierarchical" solves at 1.0°/0.5° first and refines in a corridor around that path. The result is only
+    # corridor-optimal, with no fixed bound on the cost over "astar" (measured up to 5% above it), and is only
+    # faster on long open-water routes; use it when speed matters more than the cheapest route.
+    mode: Literal["astar", "bidirectional", "hierarchical"] = "astar"
+    # Width in km of the great-circle band to search instead of the whole bounding box (default: ROUTE_CORRIDOR_KM)
+    corridor_km: Optional[float] = Field(None, gt=0)
+    # Route on the forecast for a voyage leaving at this time (naive times are UTC); needs mode "astar"
+    departure_time: Optional[datetime] = None
+    # Vessel speed for the travel time estimate and forecast routing
+    speed_knots: float = Field(15, gt=0)
 
 class RouteResponse(BaseModel):
     path: List[List[float]]  # List of [lat, lon] pairs
     distance: Optional[float] = None
     estimatedTime: Optional[float] = None
     message: Optional[str] = None
+    cached: bool = False  # True when served from the route cache
+
+class BatchRouteRequest(BaseModel):
+    routes: List[RouteRequest] = Field(..., min_length=1, max_length=ROUTE_BATCH_MAX)
+
+class OneToManyRequest(BaseModel):
+    start_latitude: float
+    start_longitude: float
+    targets: List[Coordinate] = Field(..., min_length=1, max_length=ROUTE_TARGETS_MAX)
+
+class TargetRouteResult(BaseModel):
+    index: int  # Position of the target in the request
+    status: int  # HTTP status /api/route/calculate would have answered with
+    route: Optional[RouteResponse] = None
+    cost: Optional[float] = None  # Weather-weighted length in km, comparable across targets
+    error: Optional[str] = None
+
+class OneToManyResponse(BaseModel):
+    routes: List[TargetRouteResult]
+    best: Optional[int] = None  # Index of the target with the lowest cost
+
+class BatchRouteResult(BaseModel):
+    index: int  # Position of the route in the request
+    status: int  # HTTP status /api/route/calculate would have answered with
+    route: Optional[RouteResponse] = None
+    error: Optional[str] = None
 
 # Serve old static HTML (keep for reference)
 @app.get("/", response_class=HTMLResponse)
@@ -53,75 +122,200 @@ def serve_map_ui():
 
 # Health check endpoint
 @app.get("/api/health")
-async def health_check():
+async def health_check(request: Request):
     return {
         "status": "healthy",
         "message": "AquaIntel API is running",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "route_executor": request.app.state.route_executor.stats(),
+        "route_cache": route_cache.stats()
     }
 
 # Main route calculation endpoint (keep old one for backwards compatibility)
 @app.post("/calculate-route")
-async def calculate_route_old(route_request: RouteRequest):
+async def calculate_route_old(route_request: RouteRequest, request: Request):
     """Legacy endpoint - kept for backwards compatibility"""
     start_lat = route_request.start_latitude
     start_lng = route_request.start_longitude
     end_lat = route_request.end_latitude
     end_lng = route_request.end_longitude
 
-    path = await get_path(start_lat, start_lng, end_lat, end_lng)
+    path, _ = await get_path_cached(request.app.state.db_pool, start_lat, start_lng, end_lat, end_lng,
+                                    executor=request.app.state.route_executor, mode=route_request.mode,
+                                    corridor_km=route_request.corridor_km)
     return {"path": path}
 
 # NEW API endpoint with better structure
 @app.post("/api/route/calculate", response_model=RouteResponse)
-async def calculate_route(route_request: RouteRequest):
+async def calculate_route(route_request: RouteRequest, request: Request):
     """
     Calculate optimal maritime route using A* algorithm with weather weights
     
     Returns path as list of [lat, lon] coordinate pairs
     """
     try:
-        start_lat = route_request.start_latitude
-        start_lng = route_request.start_longitude
-        end_lat = route_request.end_latitude
-        end_lng = route_request.end_longitude
+        validate_route_request(route_request)
+
+        # Call A* pathfinding; repeated requests for the same snapped endpoints come from the route cache
+        result, cached = await get_path_cached(request.app.state.db_pool, *route_args(route_request)[:4],
+                                               executor=request.app.state.route_executor, mode=route_request.mode,
+                                               corridor_km=route_request.corridor_km,
+                                               departure=departure_timestamp(route_request),
+                                               speed_knots=route_request.speed_knots)
+        return route_response(result, cached, route_request.speed_knots)
+
+    except Exception as e:
+        raise route_error(e)
+
+# Many routes in one request, streamed back as newline-delimited JSON
+@app.post("/api/route/batch")
+async def calculate_routes_batch(batch_request: BatchRouteRequest, request: Request):
+    """
+    Calculate up to ROUTE_BATCH_MAX routes at once
+
+    Weight tiles covering all the routes are loaded once and the searches run
+    in parallel. Each route is written as one BatchRouteResult line as soon as
+    it finishes, so results arrive out of order; use index to match them up.
+    """
+    routes = batch_request.routes
+    pool = request.app.state.db_pool
+    executor = request.app.state.route_executor
+
+    async def results():
+        valid = []
+        for index, route_request in enumerate(routes):
+            try:
+                validate_route_request(route_request)
+                valid.append(index)
+            except HTTPException as e:
+                yield batch_result(index, e)
+
+        finished = set()
+        try:
+            async for position, result, cached in get_paths_batch(
+                pool, [route_args(routes[index]) for index in valid], executor=executor
+            ):
+                finished.add(position)
+                try:
+                    if isinstance(result, Exception):
+                        raise result
+                    outcome = route_response(result, cached, routes[valid[position]].speed_knots)
+                except Exception as e:
+                    outcome = e
+                yield batch_result(valid[position], outcome)
+        except Exception as e:
+            # The batch itself failed (e.g. the database is busy): report every route still waiting
+            for position, index in enumerate(valid):
+                if position not in finished:
+                    yield batch_result(index, e)
 
-        # Validate coordinates
-        if not (-90 <= start_lat <= 90) or not (-180 <= start_lng <= 180):
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+# Routes from one origin to several candidate destinations with a single search
+@app.post("/api/route/one-to-many", response_model=OneToManyResponse)
+async def calculate_routes_to_targets(targets_request: OneToManyRequest, request: Request):
+    """
+    Calculate routes from one start point to up to ROUTE_TARGETS_MAX targets
+
+    One A* search over the box around all the points finds every route, so
+    choosing among several ports costs about one route calculation. best is
+    the reachable target with the lowest weather-weighted cost.
+    """
+    try:
+        if not (-90 <= targets_request.start_latitude <= 90) or not (-180 <= targets_request.start_longitude <= 180):
             raise HTTPException(status_code=400, detail="Invalid start coordinates")
-        if not (-90 <= end_lat <= 90) or not (-180 <= end_lng <= 180):
-            raise HTTPException(status_code=400, detail="Invalid end coordinates")
-
-        # Call A* pathfinding
-        result = await get_path(start_lat, start_lng, end_lat, end_lng)
-
-        # Check for errors
-        if "error" in result:
-            raise HTTPException(status_code=400, detail=result["error"])
-
-        # Format path
-        path = result.get("path", [])
-        
-        if not path:
-            raise HTTPException(status_code=404, detail="No path found")
-
-        # Calculate distance (rough estimate using Haversine)
-        distance = calculate_total_distance(path)
-        estimated_time = estimate_travel_time(distance)
-
-        return RouteResponse(
-            path=path,
-            distance=distance,
-            estimatedTime=estimated_time,
-            message="Route calculated successfully"
-        )
-
-    except HTTPException:
-        raise
+        for index, target in enumerate(targets_request.targets):
+            if not (-90 <= target.lat <= 90) or not (-180 <= target.lon <= 180):
+                raise HTTPException(status_code=400, detail=f"Invalid coordinates for target {index}")
+
+        results = await get_paths_to_targets(request.app.state.db_pool, targets_request.start_latitude,
+                                             targets_request.start_longitude,
+                                             [(target.lat, target.lon) for target in targets_request.targets],
+                                             executor=request.app.state.route_executor)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        raise route_error(e)
+
+    routes = []
+    for index, result in enumerate(results):
+        try:
+            routes.append(TargetRouteResult(index=index, status=200, route=route_response(result, False),
+                                            cost=round(result["cost"], 2)))
+        except HTTPException as e:
+            routes.append(TargetRouteResult(index=index, status=e.status_code, error=e.detail))
+
+    reachable = [route for route in routes if route.cost is not None]
+    best = min(reachable, key=lambda route: route.cost).index if reachable else None
+    return OneToManyResponse(routes=routes, best=best)
 
 # Helper functions
+def validate_route_request(route_request: RouteRequest):
+    """Raise a 400 HTTPException for coordinates off the globe"""
+    if not (-90 <= route_request.start_latitude <= 90) or not (-180 <= route_request.start_longitude <= 180):
+        raise HTTPException(status_code=400, detail="Invalid start coordinates")
+    if not (-90 <= route_request.end_latitude <= 90) or not (-180 <= route_request.end_longitude <= 180):
+        raise HTTPException(status_code=400, detail="Invalid end coordinates")
+    if route_request.departure_time is not None and route_request.mode != "astar":
+        raise HTTPException(status_code=400, detail="Routing with departure_time needs mode 'astar'")
+
+def departure_timestamp(route_request: RouteRequest) -> Optional[float]:
+    """Unix time of the request's departure, or None to route on the current weather"""
+    departure = route_request.departure_time
+    if departure is None:
+        return None
+    if departure.tzinfo is None:
+        departure = departure.replace(tzinfo=timezone.utc)
+    return departure.timestamp()
+
+def route_args(route_request: RouteRequest) -> tuple:
+    """(lat1, lon1, lat2, lon2, mode, corridor_km, departure, speed_knots) of a request, as get_paths_batch takes them"""
+    return (route_request.start_latitude, route_request.start_longitude, route_request.end_latitude,
+            route_request.end_longitude, route_request.mode, route_request.corridor_km,
+            departure_timestamp(route_request), route_request.speed_knots)
+
+def route_response(result: dict, cached: bool, speed_knots: float = 15) -> RouteResponse:
+    """RouteResponse of a get_path result, or an HTTPException if no route was found"""
+    # Check for errors
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+
+    # Format path
+    path = result.get("path", [])
+    if not path:
+        raise HTTPException(status_code=404, detail="No path found")
+
+    # Calculate distance (rough estimate using Haversine)
+    distance = calculate_total_distance(path)
+    estimated_time = estimate_travel_time(distance, speed_knots)
+
+    return RouteResponse(
+        path=path,
+        distance=distance,
+        estimatedTime=estimated_time,
+        message="Route calculated successfully",
+        cached=cached
+    )
+
+def route_error(e: Exception) -> HTTPException:
+    """HTTPException reported for an exception raised while calculating a route"""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, ExecutorSaturated):
+        return HTTPException(status_code=503, detail="Route service busy, please retry")
+    if isinstance(e, RouteTimeout):
+        return HTTPException(status_code=504, detail="Route calculation timed out")
+    if isinstance(e, asyncio.TimeoutError):
+        return HTTPException(status_code=503, detail="Database busy, please retry")
+    return HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+def batch_result(index: int, outcome) -> str:
+    """One NDJSON line of /api/route/batch for a RouteResponse or the exception raised instead"""
+    if isinstance(outcome, RouteResponse):
+        line = BatchRouteResult(index=index, status=200, route=outcome)
+    else:
+        error = route_error(outcome)
+        line = BatchRouteResult(index=index, status=error.status_code, error=error.detail)
+    return line.model_dump_json() + "\n"
+
 def calculate_total_distance(path: List[List[float]]) -> float:
     """Calculate total distance in kilometers using Haversine formula"""
     import math
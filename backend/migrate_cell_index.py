@@ -0,0 +1,150 @@
+"""
+Migrate weather_data to integer cell coordinates.
+
+Adds lat_i / lon_i (degrees * 10), backfills them from latitude / longitude in
+latitude bands, removes rows that collapse onto the same cell (keeping the
+most recent) and makes (lat_i, lon_i) the clustered primary key. Bounding-box
+query latency is measured before and after.
+
+Usage:
+    python migrate_cell_index.py [--band-degrees 5] [--benchmark-only]
+"""
+
+import argparse
+import statistics
+import time
+from database import connect_db
+from grid_engine import Grid
+from weather_loader import box_query
+
+# Mumbai to Dubai, the largest of the TEST_ROUTES boxes
+BENCHMARK_ROUTE = (18.882290, 72.861017, 25.407605, 55.313228)
+BENCHMARK_RUNS = 5
+
+LEGACY_BOX_QUERY = """
+    SELECT latitude, longitude, weight FROM weather_data
+    WHERE ROUND(latitude,1) BETWEEN %s AND %s
+    AND ROUND(longitude,1) BETWEEN %s AND %s;
+"""
+
+
+def has_cell_columns(cursor):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'weather_data'
+        AND column_name IN ('lat_i', 'lon_i');
+    """)
+    return cursor.fetchone()[0] == 2
+
+
+def primary_key_columns(cursor):
+    cursor.execute("""
+        SELECT column_name FROM information_schema.key_column_usage
+        WHERE table_schema = DATABASE() AND table_name = 'weather_data'
+        AND constraint_name = 'PRIMARY'
+        ORDER BY ordinal_position;
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def time_query(cursor, query, params):
+    """Median latency in seconds and row count of a query over several runs"""
+    timings = []
+    rows = 0
+    for _ in range(BENCHMARK_RUNS):
+        start_time = time.perf_counter()
+        cursor.execute(query, params)
+        rows = len(cursor.fetchall())
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings), rows
+
+
+def benchmark(cursor, migrated):
+    grid = Grid.from_bounds(*BENCHMARK_ROUTE)
+    if migrated:
+        latency, rows = time_query(cursor, *box_query(grid.row_min, grid.col_min, grid.n_rows, grid.n_cols))
+    else:
+        latency, rows = time_query(cursor, LEGACY_BOX_QUERY,
+                                   (grid.lat_min, grid.lat_max, grid.lon_min, grid.lon_max))
+    print(f"Bounding-box query ({grid.size} cells): {latency * 1000:.1f} ms median, {rows} rows")
+    return latency
+
+
+def migrate(conn, cursor, band_degrees):
+    if not has_cell_columns(cursor):
+        print("Adding lat_i / lon_i columns")
+        cursor.execute("""
+            ALTER TABLE weather_data
+            ADD COLUMN lat_i SMALLINT NULL FIRST,
+            ADD COLUMN lon_i SMALLINT NULL AFTER lat_i;
+        """)
+
+    # Backfill in latitude bands to keep each transaction small
+    for lat_min in range(-90, 90, band_degrees):
+        lat_max = lat_min + band_degrees
+        start_time = time.time()
+        cursor.execute("""
+            UPDATE weather_data
+            SET lat_i = ROUND(latitude * 10), lon_i = ROUND(longitude * 10)
+            WHERE latitude >= %s AND latitude < %s AND lat_i IS NULL;
+        """, (lat_min - 0.05, lat_max - 0.05 if lat_max < 90 else 90.05))
+        conn.commit()
+        print(f"Backfilled latitude [{lat_min}, {lat_max}): {cursor.rowcount} rows in {time.time() - start_time:.2f}s")
+
+    if primary_key_columns(cursor) != ["lat_i", "lon_i"]:
+        print("Removing rows that map to the same cell")
+        cursor.execute("CREATE INDEX idx_weather_cell ON weather_data (lat_i, lon_i, last_updated);")
+        cursor.execute("""
+            DELETE older FROM weather_data AS older
+            JOIN weather_data AS newer
+              ON older.lat_i = newer.lat_i AND older.lon_i = newer.lon_i
+             AND (older.last_updated < newer.last_updated
+                  OR (older.last_updated = newer.last_updated AND older.latitude < newer.latitude)
+                  OR (older.last_updated = newer.last_updated AND older.latitude = newer.latitude
+                      AND older.longitude < newer.longitude));
+        """)
+        print(f"Removed {cursor.rowcount} duplicate rows")
+        conn.commit()
+
+        print("Switching primary key to (lat_i, lon_i)")
+        cursor.execute("""
+            ALTER TABLE weather_data
+            MODIFY lat_i SMALLINT NOT NULL,
+            MODIFY lon_i SMALLINT NOT NULL,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (lat_i, lon_i),
+            DROP INDEX idx_weather_cell;
+        """)
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate weather_data to integer cell coordinates")
+    parser.add_argument("--band-degrees", type=int, default=5, help="Latitude band size for the backfill")
+    parser.add_argument("--benchmark-only", action="store_true", help="Only report bounding-box query latency")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    cursor = conn.cursor()
+    try:
+        migrated = has_cell_columns(cursor) and primary_key_columns(cursor) == ["lat_i", "lon_i"]
+
+        print("Before:" if not args.benchmark_only else "Current:")
+        before = benchmark(cursor, migrated)
+        if args.benchmark_only or migrated:
+            if migrated and not args.benchmark_only:
+                print("weather_data is already migrated")
+            return
+
+        migrate(conn, cursor, args.band_degrees)
+
+        print("After:")
+        after = benchmark(cursor, True)
+        print(f"Speedup: {before / after:.1f}x")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
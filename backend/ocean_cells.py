@@ -0,0 +1,135 @@
+"""
+Persisted list of the 0.1° sea cells the weather ingestion job refreshes.
+
+About 30% of the globe is land, and the router never enters a land cell, so
+fetching weather for it wastes API quota, wall time and weather_data rows.
+The list is derived from the land mask once and stored as a sorted ``.npy``
+array of flat cell indices (``row * LON_CELLS + col``); sorted indices keep
+each ingestion batch within a few consecutive latitude rows.
+
+Longitudes -180 and +180 are the same meridian (columns 0 and LON_PERIOD);
+only column 0 is listed, and the weight tiles read it for both.
+
+Ingestion can be limited to named operating regions with INGEST_REGIONS
+(comma-separated names from OPERATING_REGIONS, default: the whole globe).
+
+Build it with ``python ocean_cells.py``. If the file is missing the list is
+derived from the land mask on first use.
+
+Usage:
+    python ocean_cells.py [--output PATH]
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+from land_mask import CELLS_PER_DEGREE, LON_CELLS, LON_PERIOD, get_land_mask, lat_to_row, lon_to_col
+
+# The ingestion scripts import this before anything else has loaded .env
+load_dotenv()
+
+OCEAN_CELLS_PATH = os.getenv(
+    "OCEAN_CELLS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ocean_cells_0p1.npy")
+)
+
+# Operating regions as (lat_min, lat_max, lon_min, lon_max); lon_min > lon_max crosses the antimeridian
+OPERATING_REGIONS = {
+    "north_indian_ocean": (0, 30, 40, 100),
+    "south_indian_ocean": (-50, 0, 20, 120),
+    "north_atlantic": (0, 70, -80, 0),
+    "south_atlantic": (-60, 0, -70, 20),
+    "north_pacific": (0, 65, 100, 180),
+    "south_pacific": (-60, 0, 110, 180),
+    "east_pacific": (-60, 65, -180, -70),
+    "mediterranean": (30, 46, -6, 37),
+}
+
+
+def parse_region_names(text):
+    """Region names of a comma-separated list, blanks dropped"""
+    return [name.strip() for name in text.split(",") if name.strip()]
+
+
+INGEST_REGIONS = parse_region_names(os.getenv("INGEST_REGIONS", ""))
+
+
+def build_ocean_cells(land_mask=None):
+    """Sorted flat indices of every sea cell in the land mask, without the duplicate +180° column"""
+    mask = np.asarray((land_mask or get_land_mask()).mask)[:, :LON_PERIOD]
+    rows, cols = np.nonzero(mask == 0)
+    return (rows * LON_CELLS + cols).astype(np.int32)
+
+
+def save_ocean_cells(cells, path=OCEAN_CELLS_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.save(path, cells.astype(np.int32, copy=False))
+
+
+def load_ocean_cells(path=OCEAN_CELLS_PATH):
+    if os.path.exists(path):
+        cells = np.load(path, mmap_mode="r")
+        # Lists built before the +180° column was dropped still hold it
+        duplicate = cells % LON_CELLS == LON_PERIOD
+        return cells[~duplicate] if duplicate.any() else cells
+    print(f"Ocean cell list not found at {path}, deriving it from the land mask (run ocean_cells.py)")
+    return build_ocean_cells()
+
+
+def region_bounds(names):
+    """Boxes for region names, raising ValueError for unknown ones"""
+    unknown = [name for name in names if name not in OPERATING_REGIONS]
+    if unknown:
+        raise ValueError(f"Unknown regions {unknown}, expected names from {sorted(OPERATING_REGIONS)}")
+    return [OPERATING_REGIONS[name] for name in names]
+
+
+def select_ocean_cells(regions=None, cells=None):
+    """
+    Flat indices of sea cells in row-major order, limited to the union of the
+    given (lat_min, lat_max, lon_min, lon_max) boxes if any. A box with
+    lon_min > lon_max spans the antimeridian.
+    """
+    cells = np.asarray(load_ocean_cells() if cells is None else cells, dtype=np.int64)
+    if not regions:
+        return cells
+
+    rows, cols = np.divmod(cells, LON_CELLS)
+    keep = np.zeros(len(cells), dtype=bool)
+    for lat_min, lat_max, lon_min, lon_max in regions:
+        east_of_min, west_of_max = cols >= lon_to_col(lon_min), cols <= lon_to_col(lon_max)
+        in_lons = east_of_min & west_of_max if lon_min <= lon_max else east_of_min | west_of_max
+        if lon_to_col(lon_max) >= LON_PERIOD:
+            # +180° is stored as -180°
+            in_lons |= cols == 0
+        keep |= (rows >= lat_to_row(lat_min)) & (rows <= lat_to_row(lat_max)) & in_lons
+    return cells[keep]
+
+
+def cell_coordinates(cells):
+    """(lats, lons) arrays of flat cell indices"""
+    rows, cols = np.divmod(np.asarray(cells, dtype=np.int64), LON_CELLS)
+    return np.round(rows / CELLS_PER_DEGREE - 90, 1), np.round(cols / CELLS_PER_DEGREE - 180, 1)
+
+
+def ocean_coordinates(regions=None, cells=None):
+    """(lats, lons) arrays of sea cells in row-major order, limited to regions if any"""
+    return cell_coordinates(select_ocean_cells(regions, cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the list of 0.1° sea cells refreshed by ingestion")
+    parser.add_argument("--output", default=OCEAN_CELLS_PATH, help="Path of the .npy file to write")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    cells = build_ocean_cells()
+    save_ocean_cells(cells, args.output)
+
+    print(f"Wrote {args.output}: {len(cells)} sea cells, {time.time() - start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
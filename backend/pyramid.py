@@ -0,0 +1,139 @@
+"""
+Coarse-to-fine routing pyramid.
+
+A request's 0.1° Grid is aggregated into 1.0° and 0.5° levels. The route is
+solved on the 1.0° level over the whole box, then every finer level is only
+searched inside a corridor around the previous level's path, so the 0.1°
+search touches a narrow band instead of the full bounding box.
+
+Coarse cells are passable when they contain any navigable 0.1° cell, which
+keeps narrow straits open at 1.0°; their weight is the mean of those cells.
+Such a cell can join water that is not connected at 0.1° (a bay behind a
+headland), so the corridor extends two coarse cells on each side of the
+path; one cell was often blocked on coastal routes. If a corridor is still
+blocked the search retries with a wider corridor and then the whole level,
+so the pyramid never loses a route. Paths are only optimal within the
+final corridor, with no fixed bound on how far their cost can exceed A*'s
+over the whole box: measured on real routes it was up to 5% higher, more
+where a coarse path misjudges which side of land to pass.
+"""
+
+import os
+import numpy as np
+from grid_engine import Grid, SearchResult, a_star_grid
+
+# 0.1° cells per side at each level, coarsest first
+PYRAMID_FACTORS = (10, 5, 1)
+
+# Corridor half-width, in cells of the coarser level
+PYRAMID_CORRIDOR_RADIUS = int(os.getenv("PYRAMID_CORRIDOR_RADIUS", "2"))
+
+
+def coarsen(grid, factor):
+    """Aggregate a 0.1° Grid into cells of factor x factor 0.1° cells"""
+    if not grid.is_rectangular:
+        raise ValueError("The routing pyramid needs a rectangular grid")
+    row_min = grid.row_min // factor
+    col_min = grid.col_min // factor
+    n_rows = (grid.row_min + grid.n_rows - 1) // factor - row_min + 1
+    n_cols = (grid.col_min + grid.n_cols - 1) // factor - col_min + 1
+
+    # Align the fine arrays on coarse cell boundaries
+    row_offset = grid.row_min - row_min * factor
+    col_offset = grid.col_min - col_min * factor
+    valid = ~grid.land & ~np.isnan(grid.weights)
+    totals = np.zeros((n_rows * factor, n_cols * factor), dtype=np.float64)
+    counts = np.zeros(totals.shape, dtype=np.int32)
+    totals[row_offset:row_offset + grid.n_rows, col_offset:col_offset + grid.n_cols] = np.where(valid, grid.weights, 0)
+    counts[row_offset:row_offset + grid.n_rows, col_offset:col_offset + grid.n_cols] = valid
+
+    totals = totals.reshape(n_rows, factor, n_cols, factor).sum(axis=(1, 3))
+    counts = counts.reshape(n_rows, factor, n_cols, factor).sum(axis=(1, 3))
+
+    coarse = Grid(row_min, col_min, n_rows, n_cols, factor=factor, land=counts == 0)
+    np.divide(totals, counts, out=coarse.weights, where=counts > 0, casting="unsafe")
+    return coarse
+
+
+def dilate(mask, radius):
+    """Grow a boolean mask by radius cells in every direction (8-connected)"""
+    for _ in range(radius):
+        grown = mask.copy()
+        grown[1:, :] |= mask[:-1, :]
+        grown[:-1, :] |= mask[1:, :]
+        grown[:, 1:] |= grown[:, :-1].copy()
+        grown[:, :-1] |= grown[:, 1:].copy()
+        mask = grown
+    return mask
+
+
+def corridor(level_grid, cells, radius):
+    """Mask over level_grid of the given local cells, dilated by radius"""
+    mask = np.zeros((level_grid.n_rows, level_grid.n_cols), dtype=bool)
+    rows, cols = zip(*cells)
+    mask[list(rows), list(cols)] = True
+    return dilate(mask, radius)
+
+
+def restrict(level_grid, coarse_grid, coarse_mask):
+    """
+    Sub-grid of level_grid covering the coarse corridor, with every cell
+    outside the corridor marked impassable.
+    """
+    ratio = coarse_grid.factor // level_grid.factor
+    # Corridor upsampled to level resolution, in global level indices
+    fine_mask = np.repeat(np.repeat(coarse_mask, ratio, axis=0), ratio, axis=1)
+    rows, cols = np.nonzero(fine_mask)
+    mask_row0 = coarse_grid.row_min * ratio - level_grid.row_min
+    mask_col0 = coarse_grid.col_min * ratio - level_grid.col_min
+
+    row_start = max(int(rows.min()) + mask_row0, 0)
+    row_end = min(int(rows.max()) + mask_row0 + 1, level_grid.n_rows)
+    col_start = max(int(cols.min()) + mask_col0, 0)
+    col_end = min(int(cols.max()) + mask_col0 + 1, level_grid.n_cols)
+
+    allowed = fine_mask[row_start - mask_row0:row_end - mask_row0, col_start - mask_col0:col_end - mask_col0]
+    land = level_grid.land[row_start:row_end, col_start:col_end] | ~allowed
+    sub = Grid(level_grid.row_min + row_start, level_grid.col_min + col_start,
+               row_end - row_start, col_end - col_start, factor=level_grid.factor, land=land)
+    sub.weights[:] = level_grid.weights[row_start:row_end, col_start:col_end]
+    return sub
+
+
+def level_attempts(level, previous):
+    """Grids to try at a level: the corridor, a 4x wider corridor, then the whole level"""
+    if previous is not None:
+        previous_grid, previous_cells = previous
+        for radius in (PYRAMID_CORRIDOR_RADIUS, 4 * PYRAMID_CORRIDOR_RADIUS):
+            yield restrict(level, previous_grid, corridor(previous_grid, previous_cells, radius))
+    yield level
+
+
+def hierarchical_a_star_grid(grid, start, goal, deadline=None):
+    """Coarse-to-fine A* over a 0.1° Grid; same interface as a_star_grid"""
+    if grid.land[goal] or np.isnan(grid.weights[goal]):
+        return SearchResult(None, None, 0)
+
+    start_coords = grid.coords(*start)
+    goal_coords = grid.coords(*goal)
+    levels = [coarsen(grid, factor) for factor in PYRAMID_FACTORS if factor > 1] + [grid]
+
+    expanded = 0
+    previous = None
+    for level in levels:
+        for search_grid in level_attempts(level, previous):
+            level_start = search_grid.cell(*start_coords)
+            level_goal = search_grid.cell(*goal_coords)
+            result = a_star_grid(search_grid, level_start, level_goal, deadline)
+            expanded += result.expanded
+            if result.path is not None:
+                break
+
+        if result.path is None:
+            # Unreachable over a whole level, and coarse connectivity is implied by fine connectivity
+            return SearchResult(None, None, expanded)
+
+        if level is grid:
+            return SearchResult(result.path, result.cost, expanded)
+
+        previous = (search_grid, [level_start] + [search_grid.cell(*point) for point in result.path])
@@ -0,0 +1,78 @@
+"""
+Process-local cache of computed routes.
+
+Vessels request the same port pairs over and over, so finished get_path
+results are kept in an LRU keyed by the endpoints snapped to the 0.1° grid,
+the routing options and the weather version. Each entry remembers the
+weight tiles its search read, so a new weather version only drops routes
+over tiles that changed (or everything after a full refresh); entries also
+expire after the weather refresh interval as a fallback. Size is capped by
+ROUTE_CACHE_MAX_ENTRIES (default 1024).
+"""
+
+import os
+import time
+from collections import OrderedDict
+from land_mask import to_cell
+from weight_cache import WEATHER_REFRESH_INTERVAL
+
+ROUTE_CACHE_MAX_ENTRIES = int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", "1024"))
+
+
+def route_key(lat1, lon1, lat2, lon2, mode, corridor_km):
+    """Cache key: endpoints as integer 0.1° cells plus the options that change the result"""
+    return to_cell(lat1), to_cell(lon1), to_cell(lat2), to_cell(lon2), mode, corridor_km or 0
+
+
+class RouteCache:
+    """LRU of get_path results for one weather version"""
+
+    def __init__(self, max_entries=ROUTE_CACHE_MAX_ENTRIES, ttl=WEATHER_REFRESH_INTERVAL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def set_version(self, version, changed_tiles=None):
+        """
+        Switch to a weather version. Routes that read any of changed_tiles are
+        dropped; changed_tiles=None drops every route.
+        """
+        if version == self.version:
+            return
+        if changed_tiles is None:
+            self.entries.clear()
+        else:
+            for key in [key for key, entry in self.entries.items() if not entry[2].isdisjoint(changed_tiles)]:
+                del self.entries[key]
+        self.version = version
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, result, tiles):
+        self.entries[key] = (result, time.time(), frozenset(tiles))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+route_cache = RouteCache()
@@ -0,0 +1,94 @@
+"""
+Runs CPU-bound route searches off the event loop.
+
+The compact Grid (weights + land mask arrays) is shipped to a worker pool and
+only the path comes back, so a long search never blocks health checks or
+other requests on the same uvicorn worker. Configuration via environment:
+
+    ROUTE_EXECUTOR    "process" (default) or "thread"
+    ROUTE_WORKERS     pool size (default: CPU count)
+    ROUTE_QUEUE_SIZE  searches allowed running or waiting before rejecting (default 4 x workers)
+    ROUTE_TIMEOUT     seconds a single search may run once a worker picks it up (default 30)
+
+A full queue is rejected up front (ExecutorSaturated, HTTP 503). Time spent
+waiting for a worker doesn't count against ROUTE_TIMEOUT, so RouteTimeout
+(HTTP 504) only means the search itself ran too long.
+"""
+
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from grid_engine import SearchTimeout
+
+ROUTE_EXECUTOR = os.getenv("ROUTE_EXECUTOR", "process")
+ROUTE_WORKERS = int(os.getenv("ROUTE_WORKERS", str(os.cpu_count() or 1)))
+ROUTE_QUEUE_SIZE = int(os.getenv("ROUTE_QUEUE_SIZE", str(4 * ROUTE_WORKERS)))
+ROUTE_TIMEOUT = float(os.getenv("ROUTE_TIMEOUT", "30"))
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the route queue is full"""
+
+
+class RouteTimeout(Exception):
+    """Raised when a search exceeds ROUTE_TIMEOUT"""
+
+
+def run_with_timeout(search, args, timeout):
+    """Run search(*args) in a worker with a deadline counted from when the worker starts it"""
+    return search(*args, deadline=time.time() + timeout)
+
+
+class RouteExecutor:
+    def __init__(self, kind=ROUTE_EXECUTOR, workers=ROUTE_WORKERS, queue_size=ROUTE_QUEUE_SIZE, timeout=ROUTE_TIMEOUT):
+        if kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        elif kind == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        else:
+            raise ValueError(f"Unknown ROUTE_EXECUTOR {kind!r}, expected 'process' or 'thread'")
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+
+    async def run(self, search, *args):
+        """
+        Run search(*args, deadline=...) in the pool.
+
+        The deadline lets the worker stop by itself, so a timed-out search
+        doesn't keep occupying a pool slot after the caller has given up.
+        It starts when a worker picks the search up, so queueing behind
+        other searches doesn't eat into its budget.
+        """
+        if self.in_flight >= self.queue_size:
+            raise ExecutorSaturated()
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, functools.partial(run_with_timeout, search, args, self.timeout))
+            # Backstop only: the longest wait behind a full queue plus the search's own budget and a small
+            # grace period, so the worker's SearchTimeout normally wins
+            return await asyncio.wait_for(future, self.max_wait() + self.timeout + 1)
+        except (SearchTimeout, asyncio.TimeoutError):
+            raise RouteTimeout()
+        finally:
+            self.in_flight -= 1
+
+    def max_wait(self):
+        """Seconds a search can wait for a worker when every search ahead of it uses its full timeout"""
+        return -(-(self.queue_size - 1) // self.workers) * self.timeout
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "in_flight": self.in_flight,
+            "queue_size": self.queue_size
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,267 @@
+"""
+Sharded weather refresh across worker processes.
+
+In a single refresh process, JSON decoding and batch weighting share one
+event loop with the API requests. Here a coordinator splits the selected sea
+cells into latitude bands holding about the same number of cells, one per
+worker, and refreshes each band in its own process. Every worker has its own
+aiohttp session, DB pool and FetchScheduler, so a full refresh scales with
+cores and API keys.
+
+API keys are divided among the workers. With at least as many keys as
+workers, each worker gets keys of its own. Otherwise workers that share a
+key split its WEATHER_API_RATE, so the per-key limit still holds across
+processes.
+
+Workers report finished chunks and API metrics to the coordinator over a
+queue. The coordinator owns the checkpoint file (see ingest_checkpoint) and
+prints combined progress. Once every shard has finished it publishes the
+weather version. If a worker fails, the checkpoint is kept for --resume.
+
+Usage:
+    python sharded_refresh.py [--workers N] [--incremental] [--tolerance T] [--regions a,b] [--resume]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from datetime import datetime
+import numpy as np
+import database
+import store_update_weather
+from fetch_scheduler import WEATHER_API_BURST, WEATHER_API_RATE, FetchScheduler, api_keys
+from ingest_checkpoint import INGEST_CHECKPOINT_PATH, IngestCheckpoint
+from land_mask import CELLS_PER_DEGREE, LON_CELLS
+from ocean_cells import INGEST_REGIONS, parse_region_names, region_bounds, select_ocean_cells
+from store_update_weather import (BATCH_SIZE, WEATHER_CHANGE_TOLERANCE, create_pool, create_session,
+                                  open_checkpoint, region_tiles)
+from weather_version import record_refresh
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+# How often workers report API metrics and the coordinator prints progress, in seconds
+PROGRESS_INTERVAL = 30
+
+
+def latitude_shards(regions, count):
+    """
+    Split the selected sea cells into up to count latitude bands with about the
+    same number of cells. Each shard is (name, boxes): the region boxes, or the
+    whole globe, clipped to the band.
+    """
+    rows = select_ocean_cells(regions) // LON_CELLS
+    if not len(rows):
+        return []
+
+    firsts = np.unique(rows[[len(rows) * i // count for i in range(count)]])
+    lasts = np.append(firsts[1:] - 1, rows[-1])
+    shards = []
+    for index, (first, last) in enumerate(zip(firsts.tolist(), lasts.tolist())):
+        lat_min = round(first / CELLS_PER_DEGREE - 90, 1)
+        lat_max = round(last / CELLS_PER_DEGREE - 90, 1)
+        boxes = [
+            (max(box_lat_min, lat_min), min(box_lat_max, lat_max), lon_min, lon_max)
+            for box_lat_min, box_lat_max, lon_min, lon_max in (regions or [(-90, 90, -180, 180)])
+            if box_lat_min <= lat_max and box_lat_max >= lat_min
+        ]
+        shards.append((f"shard_{index + 1}_of_{len(firsts)}", boxes))
+    return shards
+
+
+def worker_keys(keys, workers, index):
+    """API keys of one worker and the share of each key's rate it may use"""
+    if len(keys) >= workers:
+        return keys[index::workers], 1.0
+    key_index = index % len(keys)
+    return [keys[key_index]], 1 / len(range(key_index, workers, len(keys)))
+
+
+class ShardCheckpoint(IngestCheckpoint):
+    """A worker's copy of the checkpoint; saving reports its finished chunks to the coordinator"""
+
+    def __init__(self, messages, settings, parts):
+        super().__init__(settings, path=None, parts=parts)
+        self.messages = messages
+
+    def save(self):
+        for part, state in self.parts.items():
+            self.messages.put(("chunks", part, state["cells"], sorted(state["chunks"]), sorted(self.changed_tiles)))
+
+    def remove(self):
+        pass
+
+
+async def report_metrics(index, scheduler, messages):
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        messages.put(("metrics", index, scheduler.metrics.stats()))
+
+
+async def refresh_shard(index, shard, settings, keys, rate_share, parts, messages):
+    name, boxes = shard
+    # This process's scheduler is limited to the worker's keys and its share of their rate
+    scheduler = FetchScheduler(keys, rate=WEATHER_API_RATE * rate_share,
+                               burst=max(1, int(WEATHER_API_BURST * rate_share)))
+    store_update_weather.fetch_scheduler = scheduler
+    checkpoint = ShardCheckpoint(messages, settings, parts)
+
+    pool = await create_pool()
+    reporter = asyncio.ensure_future(report_metrics(index, scheduler, messages))
+    try:
+        async with create_session() as session:
+            if settings["incremental"]:
+                await store_update_weather.update_weather_data_incremental(
+                    pool, session, settings["tolerance"], boxes, checkpoint, name
+                )
+            else:
+                await store_update_weather.update_weather_data_chunked(pool, session, boxes, checkpoint, name)
+    finally:
+        reporter.cancel()
+        await database.close_pool(pool)
+    messages.put(("metrics", index, scheduler.metrics.stats()))
+
+
+def run_worker(index, shard, settings, keys, rate_share, parts, messages):
+    """Worker process entry point: refresh one shard and tell the coordinator how it ended"""
+    try:
+        asyncio.run(refresh_shard(index, shard, settings, keys, rate_share, parts, messages))
+    except Exception:
+        messages.put(("failed", index, traceback.format_exc()))
+        raise SystemExit(1)
+    messages.put(("done", index, None))
+
+
+def progress_summary(checkpoint, shards, total_cells, metrics, running):
+    finished = 0
+    for name, _ in shards:
+        part = checkpoint.parts.get(name)
+        if part:
+            finished += min(len(part["chunks"]) * BATCH_SIZE, part["cells"])
+    rate = sum(stats["recent_requests_per_sec"] for stats in metrics.values())
+    return (f"{finished}/{total_cells} cells in finished chunks, {running} workers running, "
+            f"{rate:.1f} req/s, {sum(stats['failed'] for stats in metrics.values())} failed requests")
+
+
+def run_shards(checkpoint, shards, total_cells):
+    """Refresh every shard in its own process; returns the names of the shards that failed"""
+    context = multiprocessing.get_context("spawn")
+    messages = context.Queue()
+    keys = api_keys()
+
+    processes = {}
+    for index, shard in enumerate(shards):
+        shard_keys, rate_share = worker_keys(keys, len(shards), index)
+        name = shard[0]
+        parts = {name: checkpoint.parts[name]} if name in checkpoint.parts else {}
+        processes[index] = context.Process(
+            target=run_worker, name=name,
+            args=(index, shard, checkpoint.settings, shard_keys, rate_share, parts, messages)
+        )
+        processes[index].start()
+        print(f"Started {name} (pid {processes[index].pid}) with {len(shard_keys)} API key(s) "
+              f"at {rate_share:.0%} of their rate")
+
+    running = set(processes)
+    failed = []
+    metrics = {}
+    reported_at = time.time()
+    while running:
+        try:
+            kind, subject, *payload = messages.get(timeout=1)
+        except queue.Empty:
+            # A worker that was killed never reports back
+            for index in [index for index in running if processes[index].exitcode not in (None, 0)]:
+                print(f"{shards[index][0]} exited with code {processes[index].exitcode}")
+                failed.append(shards[index][0])
+                running.discard(index)
+        else:
+            if kind == "chunks":
+                cells, chunks, tiles = payload
+                checkpoint.parts[subject] = {"cells": cells, "chunks": set(chunks)}
+                checkpoint.changed_tiles.update(tuple(tile) for tile in tiles)
+                checkpoint.save()
+            elif kind == "metrics":
+                metrics[subject] = payload[0]
+            elif subject in running:
+                running.discard(subject)
+                if kind == "failed":
+                    print(f"{shards[subject][0]} failed:\n{payload[0]}")
+                    failed.append(shards[subject][0])
+                else:
+                    print(f"{shards[subject][0]} finished")
+
+        if time.time() - reported_at > PROGRESS_INTERVAL:
+            print(f"Shards: {progress_summary(checkpoint, shards, total_cells, metrics, len(running))}")
+            reported_at = time.time()
+
+    for process in processes.values():
+        process.join()
+    print(f"Shards: {progress_summary(checkpoint, shards, total_cells, metrics, 0)}")
+    print(f"Weather API: {sum(stats['requests'] for stats in metrics.values())} requests, "
+          f"{sum(stats['succeeded'] for stats in metrics.values())} ok, "
+          f"{sum(stats['throttled'] for stats in metrics.values())} throttled")
+    return failed
+
+
+async def publish(checkpoint, regions, incremental):
+    pool = await create_pool()
+    try:
+        # A full run rewrote every cell it covered: the whole globe, or the selected regions
+        changed_tiles = checkpoint.changed_tiles if incremental else (region_tiles(regions) if regions else None)
+        return await record_refresh(pool, datetime.fromtimestamp(checkpoint.started_at), datetime.now(), changed_tiles)
+    finally:
+        await database.close_pool(pool)
+
+
+def main(workers=INGEST_WORKERS, incremental=False, tolerance=WEATHER_CHANGE_TOLERANCE, region_names=INGEST_REGIONS,
+         resume=False, checkpoint_path=INGEST_CHECKPOINT_PATH):
+    checkpoint = open_checkpoint({
+        "incremental": incremental,
+        "tolerance": tolerance,
+        "regions": list(region_names),
+        "by_region": False,
+        "workers": workers
+    }, resume, checkpoint_path)
+    settings = checkpoint.settings
+    # The shard layout depends on the worker count, so a resumed run keeps the original one
+    workers = settings.get("workers", workers)
+    regions = region_bounds(settings["regions"])
+    start_time = time.time()
+
+    shards = latitude_shards(regions, workers)
+    total_cells = len(select_ocean_cells(regions))
+    print(f"Refreshing {total_cells} sea cells in {len(shards)} shards")
+    checkpoint.save()
+
+    failed = run_shards(checkpoint, shards, total_cells)
+    if failed:
+        print(f"Shards {', '.join(failed)} failed; run with --resume to finish the refresh")
+        raise SystemExit(1)
+
+    version = asyncio.run(publish(checkpoint, regions, settings["incremental"]))
+    checkpoint.remove()
+    print(f"Published weather version {version}")
+    print(f"Total processing time: {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh weather weights with several worker processes")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="worker processes, one latitude shard each (default: INGEST_WORKERS, or the CPU count)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only rewrite cells whose weight changed")
+    parser.add_argument("--tolerance", type=float, default=WEATHER_CHANGE_TOLERANCE,
+                        help="minimum weight change rewritten by --incremental")
+    parser.add_argument("--regions", default=",".join(INGEST_REGIONS),
+                        help="comma-separated operating regions to refresh (default: INGEST_REGIONS, or the whole globe)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the interrupted refresh saved in the checkpoint, with its settings")
+    parser.add_argument("--checkpoint", default=INGEST_CHECKPOINT_PATH,
+                        help="checkpoint file of finished chunks")
+    args = parser.parse_args()
+    region_names = parse_region_names(args.regions)
+    main(args.workers, args.incremental, args.tolerance, region_names, args.resume, args.checkpoint)
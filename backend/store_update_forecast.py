@@ -0,0 +1,151 @@
+"""
+Refresh the forecast weight slices used by time-dependent routing.
+
+Fetches the 5 day / 3 hour forecast of every selected sea cell through the
+rate-limited FetchScheduler, one weight tile at a time, and weights all
+entries of a tile with one vectorized calculate_grid_weights call. Each
+time step of the tile is upserted as one float16 array (see
+weather_forecast). Steps that are already in the past are deleted, and the
+refresh is published as a weather version listing the tiles it rewrote.
+
+Usage:
+    python store_update_forecast.py [--regions a,b]
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import time
+from datetime import datetime
+import numpy as np
+import database
+from database import acquire
+from fetch_scheduler import FetchScheduler
+from fetch_weather import calculate_grid_weights, parse_weather_data, weather_array
+from land_mask import LON_CELLS
+from ocean_cells import INGEST_REGIONS, cell_coordinates, parse_region_names, region_bounds, select_ocean_cells
+from store_update_weather import create_pool, create_session
+from weather_forecast import (FORECAST_DTYPE, FORECAST_STEP_SECONDS, FORECAST_STEPS, FORECAST_TABLE, TILE_CELLS,
+                              step_epoch)
+from weather_version import record_refresh
+
+FORECAST_URL = "https://api.openweathermap.org/data/2.5/forecast"
+
+# Tiles fetched at the same time; the FetchScheduler still caps requests in flight
+FORECAST_TILE_WORKERS = int(os.getenv("FORECAST_TILE_WORKERS", "4"))
+
+UPSERT_STEP = """
+    INSERT INTO weather_forecast (tile_row, tile_col, valid_at, weights) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE weights = VALUES(weights);
+"""
+
+
+def forecast_weights(responses, first, steps):
+    """
+    Weights of forecast API responses on the step axis starting at Unix time
+    first, in one vectorized pass: a (steps, len(responses)) array, NaN where
+    a response has no entry for a step.
+    """
+    weights = np.full((steps, len(responses)), np.nan, dtype=np.float32)
+    entries = [(index, entry) for index, data in enumerate(responses) for entry in data.get("list", [])]
+    if not entries:
+        return weights
+
+    cells = np.array([index for index, _ in entries])
+    slots = np.rint((np.array([entry["dt"] for _, entry in entries]) - first) / FORECAST_STEP_SECONDS).astype(np.int64)
+    values = calculate_grid_weights(weather_array([parse_weather_data(entry) for _, entry in entries]))
+    on_axis = (slots >= 0) & (slots < steps)
+    weights[slots[on_axis], cells[on_axis]] = values[on_axis]
+    return weights
+
+
+async def refresh_tile(pool, session, fetch, tile_id, cells, first, steps=FORECAST_STEPS):
+    """Fetch, weight and store the forecast of one tile's sea cells; returns the number of cells stored"""
+    lats, lons = cell_coordinates(cells)
+    responses = await asyncio.gather(
+        *(fetch(session, lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())),
+        return_exceptions=True
+    )
+    fetched = [(cell, data) for cell, data in zip(cells.tolist(), responses) if data and not isinstance(data, Exception)]
+    if not fetched:
+        return 0
+
+    flat = np.array([cell for cell, _ in fetched])
+    block = np.full((steps, TILE_CELLS, TILE_CELLS), np.nan, dtype=FORECAST_DTYPE)
+    block[:, flat // LON_CELLS - tile_id[0] * TILE_CELLS, flat % LON_CELLS - tile_id[1] * TILE_CELLS] = \
+        forecast_weights([data for _, data in fetched], first, steps)
+
+    rows = [
+        (tile_id[0], tile_id[1], first + step * FORECAST_STEP_SECONDS, block[step].tobytes())
+        for step in range(steps) if not np.isnan(block[step]).all()
+    ]
+    async with acquire(pool) as conn:
+        async with conn.cursor() as cursor:
+            await cursor.executemany(UPSERT_STEP, rows)
+        await conn.commit()
+    return len(fetched)
+
+
+def tile_cells(cells):
+    """Yield (tile_id, flat cell indices) of sorted flat cell indices, one tile at a time"""
+    tiles = (cells // LON_CELLS // TILE_CELLS) * LON_CELLS + cells % LON_CELLS // TILE_CELLS
+    order = np.argsort(tiles, kind="stable")
+    keys, starts = np.unique(tiles[order], return_index=True)
+    for key, tile in zip(keys.tolist(), np.split(cells[order], starts[1:])):
+        yield divmod(key, LON_CELLS), tile
+
+
+async def update_forecast(pool, session, regions=None, scheduler=None):
+    """Refresh the forecast of the sea cells in the given boxes (default: the globe); returns the tiles rewritten"""
+    scheduler = scheduler or FetchScheduler()
+    fetch = functools.partial(scheduler.fetch, url=FORECAST_URL)
+    first = step_epoch(time.time())
+    semaphore = asyncio.Semaphore(FORECAST_TILE_WORKERS)
+    tiles = list(tile_cells(select_ocean_cells(regions)))
+    print(f"Refreshing the forecast of {sum(len(cells) for _, cells in tiles)} sea cells in {len(tiles)} tiles")
+
+    async def refresh(tile_id, cells):
+        async with semaphore:
+            return await refresh_tile(pool, session, fetch, tile_id, cells, first)
+
+    stored = await asyncio.gather(*(refresh(tile_id, cells) for tile_id, cells in tiles))
+    print(f"Stored forecasts of {sum(stored)} cells; weather API: {scheduler.metrics.summary()}")
+
+    async with acquire(pool) as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("DELETE FROM weather_forecast WHERE valid_at < %s;", (first,))
+        await conn.commit()
+    return {tile_id for (tile_id, _), count in zip(tiles, stored) if count}
+
+
+async def main(region_names=INGEST_REGIONS):
+    regions = region_bounds(region_names)
+    if region_names:
+        print(f"Limiting the forecast to {', '.join(region_names)}")
+    pool = await create_pool()
+    started_at = datetime.now()
+    start_time = time.time()
+    try:
+        async with acquire(pool) as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(FORECAST_TABLE)
+
+        async with create_session() as session:
+            changed_tiles = await update_forecast(pool, session, regions)
+
+        # Publish a weather version so the API drops cached routes and forecast tiles over the rewritten tiles
+        version = await record_refresh(pool, started_at, datetime.now(), changed_tiles)
+        print(f"Published weather version {version}")
+    finally:
+        await database.close_pool(pool)
+    print(f"Total processing time: {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the forecast weight slices in weather_forecast")
+    parser.add_argument("--regions", default=",".join(INGEST_REGIONS),
+                        help="comma-separated operating regions to refresh (default: INGEST_REGIONS, or the whole globe)")
+    args = parser.parse_args()
+    region_names = parse_region_names(args.regions)
+    asyncio.run(main(region_names))
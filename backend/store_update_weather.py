@@ -1,128 +1,217 @@
-from fetch_weather import get_grid_weight
+from fetch_scheduler import FetchScheduler
+from ingest_checkpoint import INGEST_CHECKPOINT_PATH, ChunkProgress, IngestCheckpoint
+from land_mask import lat_to_row, lon_to_col
+from ocean_cells import (INGEST_REGIONS, cell_coordinates, ocean_coordinates, parse_region_names, region_bounds,
+                         select_ocean_cells)
+from weather_loader import load_block
+from weight_cache import tile_ids_for_cells
 import numpy as np
-import aiomysql
+import database
+import argparse
 import asyncio
 import aiohttp
+import os
 import time
+from datetime import datetime
+from weather_pipeline import run_pipeline
+from weather_version import record_refresh
+from weather_writer import pool_options, write_weather_rows
 
-# Reduce concurrent operations
-semaphore = asyncio.Semaphore(50)  # Increased from 10 for better throughput
-BATCH_SIZE = 5000  # Process in batches of 1000
+# Token-bucket rate limiting per API key, an in-flight cap and retries on 429/5xx for every API call
+fetch_scheduler = FetchScheduler()
+BATCH_SIZE = 5000  # Sea cells per checkpointed chunk
+
+# Incremental refresh only rewrites cells whose weight moved by more than this
+WEATHER_CHANGE_TOLERANCE = float(os.getenv("WEATHER_CHANGE_TOLERANCE", "0.01"))
+
+# Whole globe in latitude bands (lat_min, lat_max, lon_min, lon_max), the default for by-region refreshes
+GLOBAL_BANDS = {
+    "antarctic": (-90, -45.1, -180, 180),
+    "southern_hemisphere": (-45, -0.1, -180, 180),
+    "northern_hemisphere": (0, 44.9, -180, 180),
+    "arctic": (45, 90, -180, 180),
+}
 
 async def create_pool():
-    return await aiomysql.create_pool(
-        db="AquaIntel",
-        user="root",
-        password="password",
-        host="127.0.0.1",
-        minsize=5,
-        maxsize=20
+    return await database.create_pool(minsize=5, maxsize=20, **pool_options())
+
+def create_session():
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=100),  # Limit connections
+        timeout=aiohttp.ClientTimeout(total=30)      # Add timeout
     )
 
 async def store_weather_data_batch(pool, data_batch):
-    """Store a batch of weather data"""
-    if not data_batch:
-        return
-    
-    async with pool.acquire() as conn:
+    """Store a batch of (lat, lon, weight, last_updated) results"""
+    stored = await write_weather_rows(pool, data_batch)
+    if stored:
+        print(f"Stored batch of {stored} records")
+    return stored
+
+async def stored_weights(pool, results):
+    """Current weather_data weights for the cells of a batch, NaN where a cell has no row yet"""
+    rows = lat_to_row([result[0] for result in results])
+    cols = lon_to_col([result[1] for result in results])
+    row_min, col_min = int(rows.min()), int(cols.min())
+    weights = np.full((int(rows.max()) - row_min + 1, int(cols.max()) - col_min + 1), np.nan, dtype=np.float32)
+
+    async with database.acquire(pool) as conn:
         async with conn.cursor() as cursor:
-            query = """
-                INSERT INTO weather_data (latitude, longitude, weight, last_updated)
-                VALUES (%s, %s, %s, %s) AS new_data
-                ON DUPLICATE KEY UPDATE 
-                weight = new_data.weight, last_updated = new_data.last_updated;
-            """
-            
-            # Prepare data for executemany
-            formatted_data = []
-            for result in data_batch:
-                if result:
-                    try:
-                        # Try object attributes first
-                        if hasattr(result, 'lat'):
-                            formatted_data.append((
-                                result.lat,
-                                result.lon, 
-                                result.weight,
-                                result.last_updated
-                            ))
-                        # Try tuple/list format
-                        elif isinstance(result, (tuple, list)) and len(result) >= 4:
-                            formatted_data.append((
-                                result[0],  # lat
-                                result[1],  # lon
-                                result[2],  # weight
-                                result[3]   # last_updated
-                            ))
-                        # Try dictionary format
-                        elif isinstance(result, dict):
-                            formatted_data.append((
-                                result.get('lat') or result.get('latitude'),
-                                result.get('lon') or result.get('longitude'),
-                                result.get('weight'),
-                                result.get('last_updated')
-                            ))
-                        else:
-                            print(f"Unknown result format: {type(result)}, {result}")
-                    except Exception as e:
-                        print(f"Error processing result {result}: {e}")
-            
-            if formatted_data:
-                await cursor.executemany(query, formatted_data)
-                await conn.commit()
-                print(f"Stored batch of {len(formatted_data)} records")
-
-async def process_coordinate_batch(session, pool, coordinates):
-    """Process a batch of coordinates"""
-    async with semaphore:
-        # Get weather data for this batch
-        tasks = []
-        for lat, lon in coordinates:
-            tasks.append(get_grid_weight(session, lat, lon))
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Filter out exceptions and None results
-        valid_results = [r for r in results if r is not None and not isinstance(r, Exception)]
-        
-        # Store in database
-        await store_weather_data_batch(pool, valid_results)
-
-async def update_weather_data_chunked(pool, session):
-    """Update weather data in chunks to avoid memory issues"""
-    
-    # Generate coordinate pairs in batches
-    coordinate_batches = []
-    current_batch = []
-    
-    for lat in np.arange(-90.0, 90.0 + 0.1, 0.1):
-        for lon in np.arange(-180.0, 180.1, 0.1):
-            current_batch.append((round(lat, 1), round(lon, 1)))
-            
-            if len(current_batch) >= BATCH_SIZE:
-                coordinate_batches.append(current_batch)
-                current_batch = []
-    
-    # Don't forget the last batch
-    if current_batch:
-        coordinate_batches.append(current_batch)
-    
-    print(f"Processing {len(coordinate_batches)} batches of {BATCH_SIZE} coordinates each")
-    
-    # Process batches sequentially to control memory usage
-    for i, batch in enumerate(coordinate_batches):
-        print(f"Processing batch {i+1}/{len(coordinate_batches)}")
-        await process_coordinate_batch(session, pool, batch)
+            await load_block(cursor, weights, row_min, col_min)
+    return weights[rows - row_min, cols - col_min], rows, cols
+
+async def store_changed_weights(pool, results, tolerance, changed_tiles):
+    """
+    Write only the results whose weight is new or moved by more than tolerance.
+    Adds the tiles of written cells to changed_tiles; returns the number of cells written.
+    """
+    if not results:
+        return 0
+
+    old_weights, rows, cols = await stored_weights(pool, results)
+    new_weights = np.array([result[2] for result in results])
+    changed = np.isnan(old_weights) | (np.abs(new_weights - old_weights) > tolerance)
+
+    await store_weather_data_batch(pool, [result for result, keep in zip(results, changed) if keep])
+    changed_tiles.update(tile_ids_for_cells(rows[changed], cols[changed]))
+    return int(changed.sum())
+
+def stream_coordinates(regions=None, chunk_size=BATCH_SIZE, progress=None):
+    """
+    Yield (lat, lon) of sea cells one by one, converting the ocean cell list a
+    chunk at a time so the pipeline never holds all coordinates in memory.
+    With a ChunkProgress, only the chunks it has not finished are streamed.
+    """
+    if progress:
+        chunks = (progress.chunk_cells(chunk) for chunk in progress.pending_chunks())
+    else:
+        cells = select_ocean_cells(regions)
+        chunks = (cells[start:start + chunk_size] for start in range(0, len(cells), chunk_size))
+    for chunk in chunks:
+        lats, lons = cell_coordinates(chunk)
+        yield from zip(lats.tolist(), lons.tolist())
+
+def refresh_progress(regions, checkpoint, part):
+    """ChunkProgress of one part of a checkpointed refresh, or None without a checkpoint"""
+    if checkpoint is None:
+        return None
+    progress = ChunkProgress(checkpoint, part, select_ocean_cells(regions), BATCH_SIZE)
+    if progress.finished:
+        print(f"Skipping {len(progress.finished)} of {progress.chunk_count} finished chunks of {part}")
+    return progress
 
-async def main():
+def region_tiles(regions):
+    """Weight tiles holding the sea cells of the given boxes"""
+    lats, lons = ocean_coordinates(regions)
+    return tile_ids_for_cells(lat_to_row(lats), lon_to_col(lons))
+
+async def update_weather_data_chunked(pool, session, regions=None, checkpoint=None, part="selected"):
+    """
+    Update weather data through the streaming pipeline; fetches and DB writes overlap.
+    With a checkpoint, finished chunks are recorded under part and skipped when resuming.
+    """
+    progress = refresh_progress(regions, checkpoint, part)
+
+    async def write(results):
+        return await store_weather_data_batch(pool, results)
+
+    await run_pipeline(session, stream_coordinates(regions, progress=progress), write,
+                       fetch=fetch_scheduler.fetch, fetch_summary=fetch_scheduler.metrics.summary,
+                       done=progress.done if progress else None)
+
+async def update_weather_data_incremental(pool, session, tolerance=WEATHER_CHANGE_TOLERANCE, regions=None,
+                                          checkpoint=None, part="selected"):
+    """
+    Refresh sea cells and rewrite just the cells whose weight changed.
+    Returns the set of weight tiles (see weight_cache) holding a rewritten cell;
+    with a checkpoint this includes the tiles rewritten before a resume.
+    """
+    progress = refresh_progress(regions, checkpoint, part)
+    changed_tiles = checkpoint.changed_tiles if checkpoint else set()
+    print(f"Incremental refresh (tolerance {tolerance})")
+
+    async def write(results):
+        return await store_changed_weights(pool, results, tolerance, changed_tiles)
+
+    stats = await run_pipeline(session, stream_coordinates(regions, progress=progress), write,
+                               fetch=fetch_scheduler.fetch, fetch_summary=fetch_scheduler.metrics.summary,
+                               done=progress.done if progress else None)
+    print(f"Rewrote {stats.written} of {stats.fetched} fetched cells, {len(changed_tiles)} tiles changed")
+    return changed_tiles
+
+async def update_weather_data_by_region(pool, session, regions=None, incremental=False,
+                                        tolerance=WEATHER_CHANGE_TOLERANCE, checkpoint=None):
+    """
+    Refresh regions one after another, each checkpointed as its own part so a
+    resumed run skips the regions that already finished. regions maps names to
+    (lat_min, lat_max, lon_min, lon_max) boxes; default: GLOBAL_BANDS.
+    Returns the changed tiles of an incremental refresh, otherwise None.
+    """
+    regions = regions or GLOBAL_BANDS
+    changed_tiles = set()
+
+    for region_idx, (name, box) in enumerate(regions.items()):
+        print(f"Processing region {region_idx + 1}/{len(regions)}: {name}")
+        if incremental:
+            changed_tiles |= await update_weather_data_incremental(pool, session, tolerance, [box], checkpoint, name)
+        else:
+            await update_weather_data_chunked(pool, session, [box], checkpoint, name)
+
+    return changed_tiles if incremental else None
+
+def open_checkpoint(settings, resume, path=INGEST_CHECKPOINT_PATH):
+    """
+    The checkpoint to continue with --resume (its settings replace the given ones),
+    or a new one for a fresh run.
+    """
+    checkpoint = IngestCheckpoint.load(path) if resume else None
+    if checkpoint:
+        print(f"Resuming the refresh started {datetime.fromtimestamp(checkpoint.started_at)} with {checkpoint.settings}")
+        return checkpoint
+    if resume:
+        print(f"No checkpoint at {path}, starting a new refresh")
+    elif os.path.exists(path):
+        print(f"Replacing the checkpoint of an unfinished refresh at {path} (use --resume to continue it)")
+    return IngestCheckpoint(settings, path)
+
+async def main(incremental=False, tolerance=WEATHER_CHANGE_TOLERANCE, region_names=INGEST_REGIONS,
+               by_region=False, resume=False, checkpoint_path=INGEST_CHECKPOINT_PATH):
+    checkpoint = open_checkpoint({
+        "incremental": incremental,
+        "tolerance": tolerance,
+        "regions": list(region_names),
+        "by_region": by_region
+    }, resume, checkpoint_path)
+    incremental = checkpoint.settings["incremental"]
+    tolerance = checkpoint.settings["tolerance"]
+    region_names = checkpoint.settings["regions"]
+    by_region = checkpoint.settings["by_region"]
+
+    regions = region_bounds(region_names)
+    if region_names:
+        print(f"Limiting ingestion to {', '.join(region_names)}")
     pool = await create_pool()
     start_time = time.time()
 
-    async with aiohttp.ClientSession(
-        connector=aiohttp.TCPConnector(limit=100),  # Limit connections
-        timeout=aiohttp.ClientTimeout(total=30)      # Add timeout
-    ) as session:
-        await update_weather_data_chunked(pool, session)
+    async with create_session() as session:
+        if by_region:
+            changed_tiles = await update_weather_data_by_region(
+                pool, session, dict(zip(region_names, regions)), incremental, tolerance, checkpoint
+            )
+        elif incremental:
+            changed_tiles = await update_weather_data_incremental(pool, session, tolerance, regions, checkpoint)
+        else:
+            await update_weather_data_chunked(pool, session, regions, checkpoint)
+        if not incremental:
+            # A full run rewrote every cell it covered: the whole globe, or the selected regions
+            changed_tiles = region_tiles(regions) if regions else None
+
+    # Publish the new weather version; API caches drop the changed tiles, or everything after a full run.
+    # A resumed refresh counts from when it was first started.
+    version = await record_refresh(pool, datetime.fromtimestamp(checkpoint.started_at), datetime.now(), changed_tiles)
+    checkpoint.remove()
+    print(f"Published weather version {version}")
+    print(f"Weather API: {fetch_scheduler.metrics.summary()}")
 
     pool.close()
     await pool.wait_closed()
@@ -130,36 +219,23 @@ async def main():
     end_time = time.time()
     print(f"Total processing time: {end_time - start_time:.2f} seconds")
 
-# Alternative: Process by geographic regions
-async def update_weather_data_by_region(pool, session):
-    """Process data by geographic regions to further reduce memory usage"""
-    
-    # Define regions (lat_min, lat_max, lon_min, lon_max)
-    regions = [
-        (-90, -45, -180, 180),   # Antarctic
-        (-45, 0, -180, 180),     # Southern hemisphere
-        (0, 45, -180, 180),      # Northern hemisphere
-        (45, 90, -180, 180),     # Arctic
-    ]
-    
-    for region_idx, (lat_min, lat_max, lon_min, lon_max) in enumerate(regions):
-        print(f"Processing region {region_idx + 1}/{len(regions)}")
-        
-        current_batch = []
-        for lat in np.arange(lat_min, lat_max + 0.1, 0.1):
-            for lon in np.arange(lon_min, lon_max + 0.1, 0.1):
-                current_batch.append((round(lat, 1), round(lon, 1)))
-                
-                if len(current_batch) >= BATCH_SIZE:
-                    await process_coordinate_batch(session, pool, current_batch)
-                    current_batch = []
-        
-        # Process remaining coordinates in this region
-        if current_batch:
-            await process_coordinate_batch(session, pool, current_batch)
-
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Refresh weather weights in weather_data")
+    parser.add_argument("--incremental", action="store_true",
+                        help="skip land cells and only rewrite cells whose weight changed")
+    parser.add_argument("--tolerance", type=float, default=WEATHER_CHANGE_TOLERANCE,
+                        help="minimum weight change rewritten by --incremental")
+    parser.add_argument("--regions", default=",".join(INGEST_REGIONS),
+                        help="comma-separated operating regions to refresh (default: INGEST_REGIONS, or the whole globe)")
+    parser.add_argument("--by-region", action="store_true",
+                        help="refresh the regions one at a time (default: the globe in latitude bands)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the interrupted refresh saved in the checkpoint, with its settings")
+    parser.add_argument("--checkpoint", default=INGEST_CHECKPOINT_PATH,
+                        help="checkpoint file of finished chunks")
+    args = parser.parse_args()
+    region_names = parse_region_names(args.regions)
+    asyncio.run(main(args.incremental, args.tolerance, region_names, args.by_region, args.resume, args.checkpoint))
 
 
 # # Create scheduler to run the task every hour
@@ -0,0 +1,110 @@
+"""
+Forecast weight slices for time-dependent routing.
+
+weather_data holds one weight per cell from the current-conditions endpoint,
+so a voyage of several days is routed on weather that is stale a few hours
+after departure. store_update_forecast.py weights the 5 day / 3 hour
+forecast with the same calculate_grid_weights and stores it here, per 5°x5°
+weight tile and time step: one row of weather_forecast holds a float16
+array of TILE_CELLS x TILE_CELLS weights (5 KB), NaN where a cell has no
+forecast.
+
+Time steps sit on a fixed UTC axis every FORECAST_STEP_HOURS, so the steps
+of all tiles line up. A tile's steps are read with one primary-key range
+scan and cached as a (steps, TILE_CELLS, TILE_CELLS) block in
+forecast_cache, a TileCache of its own, so routes over the same sea area
+assemble their forecast from RAM like the current weights (see
+weight_cache). Refreshes publish a weather version listing the tiles they
+rewrote, which drops those tiles from the cache.
+
+Configuration via environment:
+
+    FORECAST_STEP_HOURS     hours between time steps (default 3, the forecast API's step)
+    FORECAST_STEPS          time steps stored per refresh (default 40, i.e. 5 days)
+    FORECAST_CACHE_MAX_MB   memory cap of the forecast tile cache (default 128)
+"""
+
+import os
+import time
+import numpy as np
+from database import acquire
+from weight_cache import TILE_CELLS, TileCache, WeightTile, copy_block_into_grid, load_tiles, tile_ids_for_grid
+
+FORECAST_STEP_HOURS = int(os.getenv("FORECAST_STEP_HOURS", "3"))
+FORECAST_STEP_SECONDS = FORECAST_STEP_HOURS * 3600
+FORECAST_STEPS = int(os.getenv("FORECAST_STEPS", "40"))
+FORECAST_CACHE_MAX_MB = int(os.getenv("FORECAST_CACHE_MAX_MB", "128"))
+
+# Stored weights: little-endian half floats, plenty for weights of about 0 to 1
+FORECAST_DTYPE = np.dtype("<f2")
+
+# valid_at is the step's Unix time in seconds, free of time zone conversions
+FORECAST_TABLE = """
+    CREATE TABLE IF NOT EXISTS weather_forecast (
+        tile_row SMALLINT NOT NULL,
+        tile_col SMALLINT NOT NULL,
+        valid_at INT UNSIGNED NOT NULL,
+        weights BLOB NOT NULL,
+        PRIMARY KEY (tile_row, tile_col, valid_at)
+    );
+"""
+
+TILE_STEPS_QUERY = "SELECT valid_at, weights FROM weather_forecast WHERE tile_row = %s AND tile_col = %s ORDER BY valid_at;"
+
+forecast_cache = TileCache(max_bytes=FORECAST_CACHE_MAX_MB * 1024 * 1024)
+
+
+def step_epoch(timestamp):
+    """Unix time of the forecast step at or before timestamp"""
+    return int(timestamp // FORECAST_STEP_SECONDS * FORECAST_STEP_SECONDS)
+
+
+async def ensure_forecast_table(pool):
+    async with acquire(pool) as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(FORECAST_TABLE)
+
+
+async def load_forecast_tile(cursor, tile_id):
+    """WeightTile of every stored step of a tile, epoch being the first step's valid_at; missing steps are NaN"""
+    await cursor.execute(TILE_STEPS_QUERY, tile_id)
+    rows = await cursor.fetchall()
+    if not rows:
+        return WeightTile(np.empty((0, TILE_CELLS, TILE_CELLS), dtype=FORECAST_DTYPE), 0, time.time())
+
+    first = int(rows[0][0])
+    weights = np.full(((int(rows[-1][0]) - first) // FORECAST_STEP_SECONDS + 1, TILE_CELLS, TILE_CELLS), np.nan,
+                      dtype=FORECAST_DTYPE)
+    for valid_at, data in rows:
+        weights[(int(valid_at) - first) // FORECAST_STEP_SECONDS] = \
+            np.frombuffer(data, dtype=FORECAST_DTYPE).reshape(TILE_CELLS, TILE_CELLS)
+    return WeightTile(weights, first, time.time())
+
+
+async def load_grid_forecast(pool, grid, departure, hours):
+    """
+    Forecast weights over a grid from the step of departure (Unix time) until
+    hours later. Returns (first step's Unix time, (steps, n_rows, n_cols)
+    float16 array), NaN where no forecast is stored. Steps after the last
+    stored one are left out, since the array is shipped to a route worker
+    and the search uses the last step past the end anyway; a departure past
+    the last stored step gets just that step.
+    """
+    tiles = await load_tiles(forecast_cache, pool, tile_ids_for_grid(grid), load_forecast_tile)
+    last = max((tile.epoch + (len(tile.weights) - 1) * FORECAST_STEP_SECONDS
+                for tile in tiles.values() if len(tile.weights)), default=None)
+    first = step_epoch(departure)
+    if last is None:
+        return first, np.empty((0, grid.n_rows, grid.n_cols), dtype=FORECAST_DTYPE)
+
+    first = min(first, last)
+    steps = min(int(np.ceil((departure + hours * 3600 - first) / FORECAST_STEP_SECONDS)) + 1,
+                (last - first) // FORECAST_STEP_SECONDS + 1)
+    forecast = np.full((steps, grid.n_rows, grid.n_cols), np.nan, dtype=FORECAST_DTYPE)
+    for tile_id, tile in tiles.items():
+        # Steps of the tile that fall on this forecast's axis
+        offset = (tile.epoch - first) // FORECAST_STEP_SECONDS
+        start, end = max(offset, 0), min(offset + len(tile.weights), steps)
+        if start < end:
+            copy_block_into_grid(grid, tile_id, tile.weights[start - offset:end - offset], forecast[start:end])
+    return first, forecast
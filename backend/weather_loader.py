@@ -0,0 +1,88 @@
+"""
+Bounding-box loader for the weather_data table.
+
+Rows are fetched with their integer cell coordinates (lat_i = latitude * 10,
+lon_i = longitude * 10) and scattered into a weight array by computed cell
+index, so a missing or extra row only affects its own cell instead of
+shifting every weight after it.
+
+A block whose columns run past either end of the globe (across the
+antimeridian) is read as two lon_i ranges and its columns wrap around.
+"""
+
+import numpy as np
+from land_mask import CELLS_PER_DEGREE, LON_CELLS, LON_PERIOD
+
+LAT_CELL_OFFSET = 90 * CELLS_PER_DEGREE
+LON_CELL_OFFSET = 180 * CELLS_PER_DEGREE
+
+# One lat_i per row gives MySQL a tight (lat_i, lon_i) primary-key range for
+# every grid row instead of scanning whole latitude bands
+BOX_QUERY = """
+    SELECT lat_i, lon_i, weight, UNIX_TIMESTAMP(last_updated) FROM weather_data
+    WHERE lat_i IN ({lat_cells})
+    AND ({lon_ranges});
+"""
+
+
+def wraps(col_min, n_cols):
+    """True if a block of columns runs past either end of the globe"""
+    return col_min < 0 or col_min + n_cols > LON_CELLS
+
+
+def col_ranges(col_min, n_cols):
+    """Inclusive global column ranges on the globe covering a block, split where it crosses the antimeridian"""
+    if not wraps(col_min, n_cols):
+        return [(col_min, col_min + n_cols - 1)]
+    first = col_min % LON_PERIOD
+    last = first + min(n_cols, LON_PERIOD) - 1
+    if last < LON_PERIOD:
+        return [(first, last)]
+    return [(first, LON_PERIOD - 1), (0, last - LON_PERIOD)]
+
+
+def box_query(row_min, col_min, n_rows, n_cols):
+    """SQL and parameters for a block of global grid rows/columns"""
+    lat_cells = list(range(row_min - LAT_CELL_OFFSET, row_min + n_rows - LAT_CELL_OFFSET))
+    ranges = col_ranges(col_min, n_cols)
+    query = BOX_QUERY.format(
+        lat_cells=", ".join(["%s"] * len(lat_cells)),
+        lon_ranges=" OR ".join(["lon_i BETWEEN %s AND %s"] * len(ranges))
+    )
+    lon_bounds = [col - LON_CELL_OFFSET for col_range in ranges for col in col_range]
+    return query, (*lat_cells, *lon_bounds)
+
+
+def scatter_weights(weights, row_min, col_min, rows):
+    """
+    Write (lat_i, lon_i, weight, ...) rows into a 2-D weight array whose
+    [0, 0] cell is global (row_min, col_min), in one vectorized pass.
+
+    Returns the number of cells written and the newest last_updated epoch
+    (0 if the rows carry no timestamp).
+    """
+    if not rows:
+        return 0, 0
+
+    # NULL weights become NaN
+    data = np.array(rows, dtype=np.float64)
+    rows_idx = data[:, 0].astype(np.int64) + LAT_CELL_OFFSET - row_min
+    cols_idx = data[:, 1].astype(np.int64) + LON_CELL_OFFSET - col_min
+
+    n_rows, n_cols = weights.shape
+    if wraps(col_min, n_cols):
+        cols_idx %= LON_PERIOD
+    inside = (rows_idx >= 0) & (rows_idx < n_rows) & (cols_idx >= 0) & (cols_idx < n_cols)
+    weights[rows_idx[inside], cols_idx[inside]] = data[inside, 2]
+
+    # last_updated may be NULL, even on every row
+    stamps = data[:, 3] if data.shape[1] > 3 else data[:0, 0]
+    stamps = stamps[~np.isnan(stamps)]
+    return int(inside.sum()), int(stamps.max()) if len(stamps) else 0
+
+
+async def load_block(cursor, weights, row_min, col_min):
+    """Fill a weight array from weather_data using an aiomysql cursor; returns (cells loaded, newest epoch)"""
+    n_rows, n_cols = weights.shape
+    await cursor.execute(*box_query(row_min, col_min, n_rows, n_cols))
+    return scatter_weights(weights, row_min, col_min, await cursor.fetchall())
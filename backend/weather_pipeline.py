@@ -0,0 +1,181 @@
+"""
+Streaming weather ingestion pipeline.
+
+    coordinates -> N fetchers -> weigher -> M writers
+
+Stages are asyncio tasks connected by bounded queues, so a full queue makes
+the stage before it wait (backpressure) and memory stays flat no matter how
+many cells are refreshed. Fetchers each keep one API request in flight; the
+weigher collects responses into batches and weights each batch with one
+vectorized calculate_grid_weights call; writers upsert finished batches
+while the fetchers keep going, so throughput is bounded by the weather API
+rather than by alternating fetch and store phases.
+
+Configuration via environment:
+
+    INGEST_FETCH_WORKERS   concurrent API requests (default 50)
+    INGEST_DB_WRITERS      concurrent DB writer tasks (default 4)
+    INGEST_QUEUE_SIZE      capacity of each queue (default 1000)
+    INGEST_WRITE_BATCH     rows per weighted batch and DB write (default 1000)
+    INGEST_FLUSH_SECONDS   longest a partial batch waits for more responses (default 2)
+"""
+
+import asyncio
+import os
+import time
+from fetch_weather import fetch_weather_data, initialization, weigh_responses
+
+INGEST_FETCH_WORKERS = int(os.getenv("INGEST_FETCH_WORKERS", "50"))
+INGEST_DB_WRITERS = int(os.getenv("INGEST_DB_WRITERS", "4"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "1000"))
+INGEST_WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", "1000"))
+INGEST_FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_SECONDS", "2"))
+
+# How often progress is printed, in seconds
+PROGRESS_INTERVAL = 30
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class PipelineStats:
+    def __init__(self):
+        self.started_at = time.time()
+        self.produced = 0
+        self.fetched = 0
+        self.failed = 0
+        self.written = 0
+
+    def summary(self):
+        elapsed = time.time() - self.started_at
+        return (f"{self.produced} queued, {self.fetched} fetched, {self.failed} failed, "
+                f"{self.written} written in {elapsed:.0f}s ({self.fetched / max(elapsed, 1e-9):.1f} fetches/s)")
+
+
+async def produce(coordinates, queue, fetch_workers, stats):
+    for coordinate in coordinates:
+        await queue.put(coordinate)
+        stats.produced += 1
+    for _ in range(fetch_workers):
+        await queue.put(_DONE)
+
+
+async def fetch_worker(session, fetch, coordinates, responses, stats, done):
+    while True:
+        coordinate = await coordinates.get()
+        if coordinate is _DONE:
+            await responses.put(_DONE)
+            return
+
+        try:
+            data = await fetch(session, *coordinate)
+        except Exception as e:
+            print(f"Exception fetching weather for {coordinate}: {e}")
+            data = None
+
+        if data:
+            stats.fetched += 1
+            await responses.put((coordinate, data))
+        else:
+            stats.failed += 1
+            if done:
+                done([coordinate])
+
+
+async def weigh(responses, batches, fetch_workers, db_writers, batch_size, flush_seconds):
+    """Collect responses into batches of up to batch_size, flushing partial batches after flush_seconds"""
+    loop = asyncio.get_running_loop()
+    running = fetch_workers
+    batch = []
+    flush_at = None
+    # One pending get outlives a flush timeout, so no response is lost and cancellation
+    # reaches this task (asyncio.wait_for can swallow it when the get completes at the same time)
+    get = None
+
+    try:
+        while running:
+            get = get or asyncio.ensure_future(responses.get())
+            timeout = None if not batch else max(flush_at - loop.time(), 0)
+            finished, _ = await asyncio.wait({get}, timeout=timeout)
+            item = None
+            if finished:
+                item, get = get.result(), None
+
+            if item is _DONE:
+                running -= 1
+            elif item is not None:
+                if not batch:
+                    flush_at = loop.time() + flush_seconds
+                batch.append(item)
+
+            if batch and (item is None or len(batch) >= batch_size or not running):
+                await batches.put(weigh_responses(batch))
+                batch = []
+    finally:
+        if get:
+            get.cancel()
+
+    for _ in range(db_writers):
+        await batches.put(_DONE)
+
+
+async def db_writer(write, batches, stats, done):
+    while True:
+        results = await batches.get()
+        if results is _DONE:
+            return
+        written = await write(results)
+        stats.written += written
+        if done:
+            done([result[:2] for result in results])
+
+
+async def report(stats, queues, fetch_summary):
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        depths = ", ".join(f"{name} {queue.qsize()}" for name, queue in queues.items())
+        fetch_info = f" | api: {fetch_summary()}" if fetch_summary else ""
+        print(f"Pipeline: {stats.summary()} | queues: {depths}{fetch_info}")
+
+
+async def run_pipeline(session, coordinates, write, fetch=fetch_weather_data,
+                       fetch_workers=INGEST_FETCH_WORKERS, db_writers=INGEST_DB_WRITERS,
+                       queue_size=INGEST_QUEUE_SIZE, batch_size=INGEST_WRITE_BATCH,
+                       flush_seconds=INGEST_FLUSH_SECONDS, fetch_summary=None, done=None):
+    """
+    Fetch, weight and write every (lat, lon) in the coordinates iterable.
+
+    write is an async callable taking a list of (lat, lon, weight, datetime)
+    tuples and returning the number of rows it wrote. fetch_summary, if
+    given, returns a line of API metrics for the progress reports. done, if
+    given, is called with lists of (lat, lon) once they are finished: written
+    to the database, or given up on after a failed fetch. If any stage fails
+    the others are cancelled and the exception propagates.
+    Returns PipelineStats.
+    """
+    initialization()
+    stats = PipelineStats()
+    coordinate_queue = asyncio.Queue(queue_size)
+    response_queue = asyncio.Queue(queue_size)
+    # Each item is a whole batch, so this queue holds fewer items
+    batch_queue = asyncio.Queue(max(queue_size // batch_size, 2 * db_writers))
+
+    tasks = [
+        asyncio.ensure_future(produce(coordinates, coordinate_queue, fetch_workers, stats)),
+        *(asyncio.ensure_future(fetch_worker(session, fetch, coordinate_queue, response_queue, stats, done))
+          for _ in range(fetch_workers)),
+        asyncio.ensure_future(weigh(response_queue, batch_queue, fetch_workers, db_writers, batch_size, flush_seconds)),
+        *(asyncio.ensure_future(db_writer(write, batch_queue, stats, done)) for _ in range(db_writers)),
+    ]
+    reporter = asyncio.ensure_future(report(stats, {
+        "coordinates": coordinate_queue, "responses": response_queue, "batches": batch_queue
+    }, fetch_summary))
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks + [reporter]:
+            task.cancel()
+
+    print(f"Pipeline finished: {stats.summary()}")
+    return stats
@@ -0,0 +1,113 @@
+"""
+Weather data version.
+
+store_update_weather.py appends a row to weather_refresh every time it
+completes a refresh, so the newest id identifies the weather data that
+routes are computed from. Incremental refreshes also list the weight tiles
+they rewrote in weather_refresh_tiles. The API polls the version at most
+every WEATHER_VERSION_POLL seconds (default 15); when it changes, cached
+routes and weight tiles are dropped for the changed tiles only, or entirely
+if a full refresh ran in between.
+"""
+
+import os
+import time
+from database import acquire
+
+WEATHER_VERSION_POLL = float(os.getenv("WEATHER_VERSION_POLL", "15"))
+
+REFRESH_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS weather_refresh (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        started_at DATETIME NOT NULL,
+        completed_at DATETIME NOT NULL,
+        incremental BOOLEAN NOT NULL DEFAULT FALSE
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS weather_refresh_tiles (
+        refresh_id INT NOT NULL,
+        tile_row SMALLINT NOT NULL,
+        tile_col SMALLINT NOT NULL,
+        PRIMARY KEY (refresh_id, tile_row, tile_col)
+    );
+    """
+)
+
+
+async def create_refresh_tables(cursor):
+    for table in REFRESH_TABLES:
+        await cursor.execute(table)
+
+
+async def ensure_refresh_tables(pool):
+    async with acquire(pool) as conn:
+        async with conn.cursor() as cursor:
+            await create_refresh_tables(cursor)
+
+
+async def record_refresh(pool, started_at, completed_at, changed_tiles=None):
+    """
+    Publish a completed refresh as a new weather version; returns the version.
+
+    changed_tiles is the set of (tile_row, tile_col) an incremental refresh
+    rewrote, or None for a full refresh that may have changed everything.
+    """
+    async with acquire(pool) as conn:
+        async with conn.cursor() as cursor:
+            await create_refresh_tables(cursor)
+            await cursor.execute(
+                "INSERT INTO weather_refresh (started_at, completed_at, incremental) VALUES (%s, %s, %s);",
+                (started_at, completed_at, changed_tiles is not None)
+            )
+            version = cursor.lastrowid
+            if changed_tiles:
+                await cursor.executemany(
+                    "INSERT INTO weather_refresh_tiles (refresh_id, tile_row, tile_col) VALUES (%s, %s, %s);",
+                    [(version, tile_row, tile_col) for tile_row, tile_col in sorted(changed_tiles)]
+                )
+            await conn.commit()
+            return version
+
+
+async def changed_tiles_between(pool, old_version, new_version):
+    """
+    Tiles rewritten by the refreshes after old_version up to new_version, or
+    None if any of them was a full refresh.
+    """
+    async with acquire(pool) as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT COUNT(*) FROM weather_refresh WHERE id > %s AND id <= %s AND NOT incremental;",
+                (old_version, new_version)
+            )
+            (full_refreshes,) = await cursor.fetchone()
+            if full_refreshes:
+                return None
+            await cursor.execute(
+                "SELECT DISTINCT tile_row, tile_col FROM weather_refresh_tiles WHERE refresh_id > %s AND refresh_id <= %s;",
+                (old_version, new_version)
+            )
+            return {(tile_row, tile_col) for tile_row, tile_col in await cursor.fetchall()}
+
+
+class WeatherVersion:
+    """Newest weather_refresh id, re-read from MySQL at most once per poll interval"""
+
+    def __init__(self, poll=WEATHER_VERSION_POLL):
+        self.poll = poll
+        self.version = None
+        self.checked_at = 0.0
+
+    async def current(self, pool):
+        if self.version is None or time.time() - self.checked_at > self.poll:
+            async with acquire(pool) as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute("SELECT COALESCE(MAX(id), 0) FROM weather_refresh;")
+                    (self.version,) = await cursor.fetchone()
+            self.checked_at = time.time()
+        return self.version
+
+
+weather_version = WeatherVersion()
@@ -0,0 +1,84 @@
+"""
+Bulk writes of weather weights into weather_data.
+
+Rows reach the writer in one format, the (lat, lon, weight, last_updated)
+tuples built by fetch_weather.weigh_responses. Each batch is loaded into a
+per-connection temporary staging table and then merged into weather_data
+with a single INSERT ... SELECT ... ON DUPLICATE KEY UPDATE and one commit.
+
+The upsert used before sent one statement per row: aiomysql only rewrites
+executemany into a multi-row INSERT when the statement ends in VALUES (...)
+or ON DUPLICATE KEY UPDATE, and the `AS new_data` row alias defeats that.
+
+WEATHER_WRITE_MODE picks how a batch reaches the staging table:
+
+    values  multi-row INSERT statements of up to ~1 MB each (default)
+    load    LOAD DATA LOCAL INFILE from a temporary CSV file; needs
+            local_infile enabled on the MySQL server
+"""
+
+import os
+import tempfile
+from database import acquire
+from land_mask import to_cell
+
+WEATHER_WRITE_MODE = os.getenv("WEATHER_WRITE_MODE", "values")
+
+WEATHER_COLUMNS = "lat_i, lon_i, latitude, longitude, weight, last_updated"
+
+CREATE_STAGING = "CREATE TEMPORARY TABLE IF NOT EXISTS weather_data_staging LIKE weather_data;"
+
+INSERT_STAGING = f"INSERT INTO weather_data_staging ({WEATHER_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s);"
+
+LOAD_STAGING = f"""
+    LOAD DATA LOCAL INFILE %s INTO TABLE weather_data_staging
+    FIELDS TERMINATED BY ',' LINES TERMINATED BY '\\n' ({WEATHER_COLUMNS});
+"""
+
+# Upserts hit the clustered (lat_i, lon_i) primary key
+MERGE_STAGING = f"""
+    INSERT INTO weather_data ({WEATHER_COLUMNS})
+    SELECT * FROM (SELECT {WEATHER_COLUMNS} FROM weather_data_staging) AS new_data
+    ON DUPLICATE KEY UPDATE weight = new_data.weight, last_updated = new_data.last_updated;
+"""
+
+
+def pool_options(mode=WEATHER_WRITE_MODE):
+    """Extra aiomysql connection options the write mode needs"""
+    return {"local_infile": True} if mode == "load" else {}
+
+
+def weather_rows(results):
+    """weather_data rows (lat_i, lon_i, latitude, longitude, weight, last_updated) of (lat, lon, weight, last_updated) tuples"""
+    return [(to_cell(lat), to_cell(lon), lat, lon, weight, last_updated) for lat, lon, weight, last_updated in results]
+
+
+async def load_staging_file(cursor, rows):
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+        f.writelines(
+            f"{lat_i},{lon_i},{lat},{lon},{weight!r},{last_updated:%Y-%m-%d %H:%M:%S}\n"
+            for lat_i, lon_i, lat, lon, weight, last_updated in rows
+        )
+    try:
+        await cursor.execute(LOAD_STAGING, (f.name,))
+    finally:
+        os.remove(f.name)
+
+
+async def write_weather_rows(pool, results, mode=WEATHER_WRITE_MODE):
+    """Upsert (lat, lon, weight, last_updated) tuples into weather_data; returns the number of rows"""
+    if not results:
+        return 0
+
+    rows = weather_rows(results)
+    async with acquire(pool) as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(CREATE_STAGING)
+            await cursor.execute("TRUNCATE TABLE weather_data_staging;")
+            if mode == "load":
+                await load_staging_file(cursor, rows)
+            else:
+                await cursor.executemany(INSERT_STAGING, rows)
+            await cursor.execute(MERGE_STAGING)
+        await conn.commit()
+    return len(rows)
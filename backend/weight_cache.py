@@ -0,0 +1,197 @@
+"""
+Process-local cache of weather weight tiles.
+
+The globe is cut into fixed 5°x5° tiles on the 0.1° cell layout. Each cached
+tile is a float32 NumPy block together with the newest last_updated epoch of
+its rows. Entries expire after the weather refresh interval and the cache
+evicts least-recently-used tiles once it exceeds its memory cap, so repeated
+routes over the same sea area are assembled from RAM instead of MySQL.
+
+A grid across the antimeridian reads its columns past ±180° from the tiles
+at the other end of the globe (column modulo LON_PERIOD).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from database import acquire
+from land_mask import CELLS_PER_DEGREE, LON_CELLS, LON_PERIOD
+from weather_loader import load_block
+
+TILE_DEGREES = 5
+TILE_CELLS = TILE_DEGREES * CELLS_PER_DEGREE
+# Tile columns once around the globe
+TILE_COLS = LON_PERIOD // TILE_CELLS
+
+# Matches the 30-minute refresh cycle of store_update_weather.py
+WEATHER_REFRESH_INTERVAL = int(os.getenv("WEATHER_REFRESH_INTERVAL", "1800"))
+WEIGHT_CACHE_MAX_MB = int(os.getenv("WEIGHT_CACHE_MAX_MB", "128"))
+
+
+class WeightTile:
+    __slots__ = ("weights", "epoch", "loaded_at")
+
+    def __init__(self, weights, epoch, loaded_at):
+        self.weights = weights
+        self.epoch = epoch
+        self.loaded_at = loaded_at
+
+
+class TileCache:
+    """LRU cache of WeightTiles keyed by (tile_row, tile_col) with a TTL and a byte cap"""
+
+    def __init__(self, max_bytes=WEIGHT_CACHE_MAX_MB * 1024 * 1024, ttl=WEATHER_REFRESH_INTERVAL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.tiles = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, tile_id):
+        with self.lock:
+            tile = self.tiles.get(tile_id)
+            if tile is None or time.time() - tile.loaded_at > self.ttl:
+                if tile is not None:
+                    self._remove(tile_id)
+                self.misses += 1
+                return None
+            self.tiles.move_to_end(tile_id)
+            self.hits += 1
+            return tile
+
+    def put(self, tile_id, tile):
+        with self.lock:
+            if tile_id in self.tiles:
+                self._remove(tile_id)
+            self.tiles[tile_id] = tile
+            self.nbytes += tile.weights.nbytes
+            while self.nbytes > self.max_bytes and len(self.tiles) > 1:
+                self._remove(next(iter(self.tiles)))
+
+    def invalidate(self, tile_ids=None):
+        """Drop the given tiles, or everything when tile_ids is None"""
+        with self.lock:
+            for tile_id in list(self.tiles) if tile_ids is None else tile_ids:
+                if tile_id in self.tiles:
+                    self._remove(tile_id)
+
+    def _remove(self, tile_id):
+        self.nbytes -= self.tiles.pop(tile_id).weights.nbytes
+
+    def stats(self):
+        return {
+            "tiles": len(self.tiles),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def tile_ids_for_grid(grid):
+    """Tiles overlapping a grid's rows, in row-major order"""
+    tile_ids = []
+    for tile_row in range(grid.row_min // TILE_CELLS, (grid.row_min + grid.n_rows - 1) // TILE_CELLS + 1):
+        # Column span of the grid rows inside this band of tiles
+        first = max(tile_row * TILE_CELLS - grid.row_min, 0)
+        col_starts = grid.col_starts[first:(tile_row + 1) * TILE_CELLS - grid.row_min]
+        if grid.wraps:
+            # Tile columns past either end of the globe wrap around, each listed once
+            tile_cols = range(int(col_starts.min()) // TILE_CELLS, (int(col_starts.max()) + grid.n_cols - 1) // TILE_CELLS + 1)
+            tile_ids.extend((tile_row, tile_col) for tile_col in dict.fromkeys(tile_col % TILE_COLS for tile_col in tile_cols))
+            continue
+        col_start = max(int(col_starts.min()), 0)
+        col_end = min(int(col_starts.max()) + grid.n_cols - 1, LON_CELLS - 1)
+        tile_ids.extend((tile_row, tile_col) for tile_col in range(col_start // TILE_CELLS, col_end // TILE_CELLS + 1))
+    return tile_ids
+
+
+def tile_ids_for_cells(rows, cols):
+    """Set of tiles holding the given global 0.1° cells (row and column arrays)"""
+    tiles = np.unique(np.column_stack([np.asarray(rows) // TILE_CELLS, np.asarray(cols) // TILE_CELLS]), axis=0)
+    return {(int(tile_row), int(tile_col)) for tile_row, tile_col in tiles}
+
+
+async def load_tile(cursor, tile_id):
+    weights = np.full((TILE_CELLS, TILE_CELLS), np.nan, dtype=np.float32)
+    _, epoch = await load_block(cursor, weights, tile_id[0] * TILE_CELLS, tile_id[1] * TILE_CELLS)
+    return WeightTile(weights, epoch, time.time())
+
+
+def copy_tile_into_grid(grid, tile_id, tile):
+    """Copy the part of a tile that overlaps the grid into grid.weights"""
+    copy_block_into_grid(grid, tile_id, tile.weights, grid.weights)
+
+
+def copy_block_into_grid(grid, tile_id, source, target):
+    """
+    Copy the part of a tile's cells that overlaps the grid from source
+    (..., TILE_CELLS, TILE_CELLS) into target (..., n_rows, n_cols). Leading
+    axes, e.g. forecast time steps, are copied as they are.
+    """
+    tile_row0 = tile_id[0] * TILE_CELLS
+    tile_col0 = tile_id[1] * TILE_CELLS
+    row_start = max(grid.row_min, tile_row0)
+    row_end = min(grid.row_min + grid.n_rows, tile_row0 + TILE_CELLS)
+    if grid.is_rectangular and not grid.wraps:
+        col_start = max(grid.col_min, tile_col0)
+        col_end = min(grid.col_min + grid.n_cols, tile_col0 + TILE_CELLS)
+        target[..., row_start - grid.row_min:row_end - grid.row_min, col_start - grid.col_min:col_end - grid.col_min] = \
+            source[..., row_start - tile_row0:row_end - tile_row0, col_start - tile_col0:col_end - tile_col0]
+        return
+
+    # Corridor grids and grids across the antimeridian: every row window starts at its own column
+    local_rows = np.arange(row_start - grid.row_min, row_end - grid.row_min)
+    cols = grid.col_starts[local_rows, None] + np.arange(grid.n_cols)[None, :]
+    if grid.wraps:
+        cols = cols % LON_PERIOD
+    tile_cols = cols - tile_col0
+    inside = (tile_cols >= 0) & (tile_cols < TILE_CELLS)
+    rows, cols = np.nonzero(inside)
+    target[..., local_rows[rows], cols] = source[..., local_rows[rows] + grid.row_min - tile_row0, tile_cols[rows, cols]]
+
+
+async def load_tiles(cache, pool, tile_ids, loader=load_tile):
+    """
+    WeightTiles keyed by tile id, from the cache or, for missing tiles, read by loader(cursor, tile_id).
+    A pooled connection is only acquired when at least one tile is missing.
+    """
+    tiles = {}
+    missing = []
+    for tile_id in tile_ids:
+        tile = cache.get(tile_id)
+        if tile is None:
+            missing.append(tile_id)
+        else:
+            tiles[tile_id] = tile
+
+    if missing:
+        async with acquire(pool) as conn:
+            async with conn.cursor() as cursor:
+                for tile_id in missing:
+                    tile = await loader(cursor, tile_id)
+                    cache.put(tile_id, tile)
+                    tiles[tile_id] = tile
+
+    return tiles
+
+
+def fill_grid_weights(grid, tiles):
+    """Copy loaded tiles (tile id -> WeightTile) into grid.weights; returns the newest epoch among them"""
+    for tile_id, tile in tiles.items():
+        copy_tile_into_grid(grid, tile_id, tile)
+    return max(tile.epoch for tile in tiles.values())
+
+
+async def load_grid_weights_cached(cache, pool, grid):
+    """
+    Fill grid.weights from cached tiles, loading missing tiles from MySQL.
+    Returns the newest epoch among the tiles used.
+    """
+    return fill_grid_weights(grid, await load_tiles(cache, pool, tile_ids_for_grid(grid)))
+
+
+weight_cache = TileCache()